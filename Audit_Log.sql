@@ -0,0 +1,174 @@
+--AUDIT LOG: Append-Only Change Events for Every Write Path
+
+--Every insert, update and delete on the application tables, whether it comes from the Add Data forms,
+--a stored procedure or another trigger (e.g. update_book_stock), is recorded as one compact row:
+--the table, the operation, the row's primary key, only the columns that changed, and who made the change.
+--Consumers (caches, rollups, reports) follow the log instead of rescanning tables, either by polling it
+--in batches or by LISTENing on the libtech_changes channel, which carries the name of each changed table
+--once per transaction.
+--Event_ID is taken when a row is inserted, not when its transaction commits, so a long transaction can
+--make id N visible after N + 1 and a cursor on "Event_ID > last seen" would skip N. Consumers poll by
+--transaction instead: every Txid below txid_snapshot_xmin(txid_current_snapshot()) has ended, so each
+--poll reads the Txids between the previous horizon and the current one (see the example at the end).
+
+
+
+--TABLE:
+
+CREATE TABLE Change_Events (
+    Event_ID BIGSERIAL,
+    Occurred_At TIMESTAMPTZ NOT NULL DEFAULT now(),
+    Table_Name TEXT NOT NULL,
+    Operation CHAR(1) NOT NULL CHECK (Operation IN ('I', 'U', 'D')),
+    Row_Key JSONB NOT NULL,       --primary key columns of the affected row
+    Old_Row_Key JSONB,            --primary key columns before an update that changed them, else NULL
+    Changes JSONB,                --full row for inserts, changed columns only for updates, NULL for deletes
+    Changed_By TEXT NOT NULL,     --the app's logged-in user (libtech.app_user) or the database user
+    Txid BIGINT NOT NULL DEFAULT txid_current(),
+
+    CONSTRAINT pk_Change_Events PRIMARY KEY (Event_ID)
+);
+
+CREATE INDEX idx_change_events_table ON Change_Events (Table_Name, Event_ID);
+CREATE INDEX idx_change_events_txid ON Change_Events (Txid, Event_ID);
+CREATE INDEX idx_change_events_table_txid ON Change_Events (Table_Name, Txid);
+
+--Logs created before Old_Row_Key existed: add the column, then re-run log_change_event() below
+--ALTER TABLE Change_Events ADD COLUMN Old_Row_Key JSONB;
+
+
+
+--TRIGGERS:
+
+--Trigger1: Record a change event. Arguments: the logical table name, then its primary key columns.
+
+CREATE OR REPLACE FUNCTION log_change_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    new_row JSONB;
+    old_row JSONB;
+    key_row JSONB;
+    new_key JSONB;
+    old_key JSONB;
+    changes JSONB;
+BEGIN
+    -- Secrets are never copied into the log
+    IF TG_OP <> 'DELETE' THEN
+        new_row := to_jsonb(NEW) - 'passcode' - 'passcode_hash';
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        old_row := to_jsonb(OLD) - 'passcode' - 'passcode_hash';
+    END IF;
+    key_row := COALESCE(new_row, old_row);
+
+    IF TG_OP = 'INSERT' THEN
+        changes := new_row;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT jsonb_object_agg(n.key, n.value) INTO changes
+        FROM jsonb_each(new_row) n
+        WHERE n.value IS DISTINCT FROM old_row -> n.key;
+        IF changes IS NULL THEN
+            RETURN NULL;   -- nothing actually changed
+        END IF;
+    END IF;
+
+    SELECT jsonb_object_agg(k.col, key_row -> k.col), jsonb_object_agg(k.col, old_row -> k.col)
+    INTO new_key, old_key
+    FROM unnest(TG_ARGV[1:]) AS k(col);
+    -- An update that moves a row to another key (e.g. a new Date_Out) also records where it was
+    IF TG_OP <> 'UPDATE' OR old_key = new_key THEN
+        old_key := NULL;
+    END IF;
+
+    INSERT INTO Change_Events (Table_Name, Operation, Row_Key, Old_Row_Key, Changes, Changed_By)
+    VALUES (
+        TG_ARGV[0],
+        LEFT(TG_OP, 1),
+        new_key,
+        old_key,
+        changes,
+        COALESCE(NULLIF(current_setting('libtech.app_user', true), ''), session_user)
+    );
+
+    -- Identical payloads are delivered once per transaction, so a batch of writes to one table sends one notification
+    PERFORM pg_notify('libtech_changes', TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER audit_authentication_system AFTER INSERT OR UPDATE OR DELETE ON Authentication_System
+FOR EACH ROW EXECUTE FUNCTION log_change_event('authentication_system', 'email');
+CREATE TRIGGER audit_customer AFTER INSERT OR UPDATE OR DELETE ON Customer
+FOR EACH ROW EXECUTE FUNCTION log_change_event('customer', 'username');
+CREATE TRIGGER audit_libraryy AFTER INSERT OR UPDATE OR DELETE ON Libraryy
+FOR EACH ROW EXECUTE FUNCTION log_change_event('libraryy', 'branchid');
+CREATE TRIGGER audit_staff AFTER INSERT OR UPDATE OR DELETE ON Staff
+FOR EACH ROW EXECUTE FUNCTION log_change_event('staff', 'ssn');
+CREATE TRIGGER audit_dependents AFTER INSERT OR UPDATE OR DELETE ON Dependents
+FOR EACH ROW EXECUTE FUNCTION log_change_event('dependents', 'ssn', 'dep_name');
+CREATE TRIGGER audit_supplier AFTER INSERT OR UPDATE OR DELETE ON Supplier
+FOR EACH ROW EXECUTE FUNCTION log_change_event('supplier', 'supp_name', 'address');
+CREATE TRIGGER audit_publisher AFTER INSERT OR UPDATE OR DELETE ON Publisher
+FOR EACH ROW EXECUTE FUNCTION log_change_event('publisher', 'publisher_name');
+CREATE TRIGGER audit_items AFTER INSERT OR UPDATE OR DELETE ON Items
+FOR EACH ROW EXECUTE FUNCTION log_change_event('items', 'barcode');
+CREATE TRIGGER audit_books_for_sale AFTER INSERT OR UPDATE OR DELETE ON Books_for_Sale
+FOR EACH ROW EXECUTE FUNCTION log_change_event('books_for_sale', 'isbn');
+CREATE TRIGGER audit_books_for_rent AFTER INSERT OR UPDATE OR DELETE ON Books_for_Rent
+FOR EACH ROW EXECUTE FUNCTION log_change_event('books_for_rent', 'bookid');
+CREATE TRIGGER audit_authors_booksale AFTER INSERT OR UPDATE OR DELETE ON Authors_BookSale
+FOR EACH ROW EXECUTE FUNCTION log_change_event('authors_booksale', 'isbn', 'author_name');
+CREATE TRIGGER audit_authors_bookrent AFTER INSERT OR UPDATE OR DELETE ON Authors_BookRent
+FOR EACH ROW EXECUTE FUNCTION log_change_event('authors_bookrent', 'bookid', 'author_name');
+CREATE TRIGGER audit_stores_items AFTER INSERT OR UPDATE OR DELETE ON Stores_Items
+FOR EACH ROW EXECUTE FUNCTION log_change_event('stores_items', 'branchid', 'barcode');
+CREATE TRIGGER audit_stores_booksforsale AFTER INSERT OR UPDATE OR DELETE ON Stores_Booksforsale
+FOR EACH ROW EXECUTE FUNCTION log_change_event('stores_booksforsale', 'branchid', 'isbn');
+CREATE TRIGGER audit_buys_books AFTER INSERT OR UPDATE OR DELETE ON Buys_Books
+FOR EACH ROW EXECUTE FUNCTION log_change_event('buys_books', 'username', 'branchid', 'isbn', 'date_time');
+CREATE TRIGGER audit_purchases_items AFTER INSERT OR UPDATE OR DELETE ON Purchases_Items
+FOR EACH ROW EXECUTE FUNCTION log_change_event('purchases_items', 'username', 'branchid', 'barcode', 'date_time');
+CREATE TRIGGER audit_borrows AFTER INSERT OR UPDATE OR DELETE ON Borrows
+FOR EACH ROW EXECUTE FUNCTION log_change_event('borrows', 'username', 'bookid', 'date_out');
+CREATE TRIGGER audit_sale_to_rent AFTER INSERT OR UPDATE OR DELETE ON Sale_to_Rent
+FOR EACH ROW EXECUTE FUNCTION log_change_event('sale_to_rent', 'bookid', 'isbn');
+
+--Trigger2: Keep the log append-only
+
+CREATE OR REPLACE FUNCTION prevent_change_event_rewrite()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'Change_Events is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_prevent_change_event_rewrite
+BEFORE UPDATE OR DELETE ON Change_Events
+FOR EACH ROW
+EXECUTE FUNCTION prevent_change_event_rewrite();
+
+REVOKE UPDATE, DELETE, TRUNCATE ON Change_Events FROM PUBLIC;
+GRANT SELECT ON Change_Events TO Managerr;
+
+
+
+--Example usage:
+
+--Polling cursor: take the current horizon, then read the transactions that ended since the previous one
+--(here 0), paging by Event_ID; the horizon read first becomes the consumer's new position
+SELECT txid_snapshot_xmin(txid_current_snapshot()) AS Horizon;
+
+SELECT Event_ID, Table_Name, Operation, Row_Key, Changes, Changed_By, Occurred_At, Txid
+FROM Change_Events
+WHERE Txid >= 0 AND Txid < 1000000 AND Event_ID > 0   --previous horizon, current horizon, last id of this window
+ORDER BY Event_ID
+LIMIT 1000;
+
+--Push: get woken up when a table changes, then poll as above
+LISTEN libtech_changes;
+
+--Who changed a given loan, and how
+SELECT Occurred_At, Operation, Changes, Changed_By
+FROM Change_Events
+WHERE Table_Name = 'borrows' AND Row_Key @> '{"username": "en01"}'
+ORDER BY Event_ID;
@@ -142,3 +142,92 @@ WHERE Email = 'myh17@gmail.com';
 
 
 
+
+
+--Security Mechanism 5: Password Hashing for Login
+
+--pgp_sym_decrypt is deliberately slow and cannot be indexed, so verifying a login against the
+--encrypted Passcode costs a decryption per attempt. Passcodes are instead stored as salted bcrypt
+--hashes (pgcrypto crypt/gen_salt) whose work factor can be raised over time.
+
+ALTER TABLE Authentication_System ADD COLUMN Passcode_Hash TEXT;
+ALTER TABLE Authentication_System ALTER COLUMN Passcode DROP NOT NULL;
+ALTER TABLE Authentication_System
+ADD CONSTRAINT chk_passcode_stored CHECK (Passcode IS NOT NULL OR Passcode_Hash IS NOT NULL);
+
+--Migration: hash every existing encrypted passcode (the app also upgrades legacy rows on their next login)
+UPDATE Authentication_System
+SET Passcode_Hash = crypt(pgp_sym_decrypt(Passcode, 's3cUr3!kEy#2023@P0stgreSQL^'), gen_salt('bf', 10))
+WHERE Passcode_Hash IS NULL;
+
+--Once every row has a hash, the encrypted copies are no longer needed:
+--UPDATE Authentication_System SET Passcode = NULL;
+
+--Hashing:
+INSERT INTO Authentication_System (Email, Passcode_Hash) VALUES ('tk21@gmail.com', crypt('Tk21Pass#', gen_salt('bf', 10)));
+
+--Verification:
+SELECT Email, Passcode_Hash = crypt('Tk21Pass#', Passcode_Hash) AS Valid
+FROM Authentication_System
+WHERE Email = 'tk21@gmail.com';
+
+
+
+
+--Security Mechanism 6: Row-Level Security for App Sessions
+
+--Borrower_Policy compares Username with CURRENT_USER, but every app user shares the app's single database
+--login, so it never matched anyone. The app now checks out a pooled connection for each customer or staff
+--request and scopes that transaction with SET LOCAL ROLE (Customerr or Librariann) and the setting
+--app.current_user (the customer's Username). Both end with the transaction, so the connection is clean
+--again when it goes back to the pool. The policies below filter on app.current_user.
+--The reports still run on the app's own connection, which must bypass RLS (owner with BYPASSRLS, or superuser).
+
+--The app's login role must be allowed to switch into the session roles:
+--GRANT Customerr, Librariann TO <app login role>;
+
+DROP POLICY Borrower_Policy ON Borrows;
+
+CREATE POLICY Customer_Own_Borrows ON Borrows
+FOR SELECT TO Customerr
+USING (Username = current_setting('app.current_user', true));
+
+CREATE POLICY Staff_All_Borrows ON Borrows
+FOR ALL TO Librariann, Managerr
+USING (true) WITH CHECK (true);
+
+ALTER TABLE Buys_Books ENABLE ROW LEVEL SECURITY;
+CREATE POLICY Customer_Own_Book_Purchases ON Buys_Books
+FOR SELECT TO Customerr
+USING (Username = current_setting('app.current_user', true));
+CREATE POLICY Staff_All_Book_Purchases ON Buys_Books
+FOR ALL TO Librariann, Managerr
+USING (true) WITH CHECK (true);
+
+ALTER TABLE Purchases_Items ENABLE ROW LEVEL SECURITY;
+CREATE POLICY Customer_Own_Item_Purchases ON Purchases_Items
+FOR SELECT TO Customerr
+USING (Username = current_setting('app.current_user', true));
+CREATE POLICY Staff_All_Item_Purchases ON Purchases_Items
+FOR ALL TO Librariann, Managerr
+USING (true) WITH CHECK (true);
+
+ALTER TABLE Customer ENABLE ROW LEVEL SECURITY;
+CREATE POLICY Customer_Own_Profile ON Customer
+FOR SELECT TO Customerr
+USING (Username = current_setting('app.current_user', true));
+CREATE POLICY Staff_All_Customers ON Customer
+FOR ALL TO Librariann, Managerr
+USING (true) WITH CHECK (true);
+
+GRANT SELECT ON Borrows, Buys_Books, Purchases_Items, Customer, Items TO Customerr;
+GRANT SELECT ON Buys_Books, Purchases_Items, Books_for_Sale, Books_for_Rent, Items TO Librariann;
+
+--Indexing: every policy compares Username, the leading column of each table's primary key, and
+--current_setting() is STABLE, so a customer's rows are found with an index scan rather than a filtered
+--sequential scan. Check it with:
+BEGIN;
+SET LOCAL ROLE Customerr;
+SELECT set_config('app.current_user', 'en01', true);
+EXPLAIN SELECT * FROM Borrows;   --expect an Index Scan / Bitmap Index Scan using pk_Borrows
+ROLLBACK;
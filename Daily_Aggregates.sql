@@ -0,0 +1,197 @@
+--TIME-SERIES ANALYTICS: Daily Pre-Aggregated Fact Tables
+
+--Reports over an arbitrary date range used to scan every raw row of Borrows, Buys_Books and Purchases_Items.
+--These tables keep one row per day and branch/ISBN/barcode instead, so any window at day, week or month
+--granularity is answered by summing the buckets (see the "Time-Series Analytics" page of app.py).
+--Triggers keep the buckets current as rows are inserted, updated (moved to another day, branch, title or
+--quantity) or deleted; refresh_daily_aggregates() backfills or repairs any range.
+
+
+
+--TABLES:
+
+CREATE TABLE Daily_Borrows (
+    Day DATE NOT NULL,
+    BranchID VARCHAR(10) NOT NULL,   --'UNKNOWN' when the rented copy has no branch
+    ISBN CHAR(13) NOT NULL,
+    Borrow_Count INT NOT NULL DEFAULT 0 CHECK (Borrow_Count >= 0),
+
+    CONSTRAINT pk_Daily_Borrows PRIMARY KEY (Day, BranchID, ISBN)
+);
+
+CREATE TABLE Daily_Book_Sales (
+    Day DATE NOT NULL,
+    BranchID VARCHAR(10) NOT NULL,
+    ISBN CHAR(13) NOT NULL,
+    Quantity INT NOT NULL DEFAULT 0 CHECK (Quantity >= 0),
+    Revenue NUMERIC(12, 2) NOT NULL DEFAULT 0,
+
+    CONSTRAINT pk_Daily_Book_Sales PRIMARY KEY (Day, BranchID, ISBN)
+);
+
+CREATE TABLE Daily_Item_Sales (
+    Day DATE NOT NULL,
+    BranchID VARCHAR(10) NOT NULL,
+    Barcode VARCHAR(16) NOT NULL,
+    Quantity INT NOT NULL DEFAULT 0 CHECK (Quantity >= 0),
+    Revenue NUMERIC(12, 2) NOT NULL DEFAULT 0,
+
+    CONSTRAINT pk_Daily_Item_Sales PRIMARY KEY (Day, BranchID, Barcode)
+);
+
+
+
+--TRIGGERS:
+
+--Each trigger takes an updated or deleted row out of its old bucket and puts an inserted or updated row
+--into its new one. Updates only fire for the columns that pick the bucket or its amounts, so returning a
+--book (Status) does not touch the rollups. The DROPs let the script upgrade the INSERT-only triggers.
+
+--Trigger1: Count each loan in its day's bucket
+
+CREATE OR REPLACE FUNCTION rollup_borrow()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE Daily_Borrows d
+        SET Borrow_Count = GREATEST(d.Borrow_Count - 1, 0)
+        FROM Books_for_Rent br
+        WHERE br.BookID = OLD.BookID
+        AND d.Day = OLD.Date_Out AND d.BranchID = COALESCE(br.BranchID, 'UNKNOWN') AND d.ISBN = br.ISBN;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Daily_Borrows (Day, BranchID, ISBN, Borrow_Count)
+        SELECT NEW.Date_Out, COALESCE(br.BranchID, 'UNKNOWN'), br.ISBN, 1
+        FROM Books_for_Rent br
+        WHERE br.BookID = NEW.BookID
+        ON CONFLICT (Day, BranchID, ISBN)
+        DO UPDATE SET Borrow_Count = Daily_Borrows.Borrow_Count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_rollup_borrow ON Borrows;
+CREATE TRIGGER trigger_rollup_borrow
+AFTER INSERT OR DELETE OR UPDATE OF Date_Out, BookID ON Borrows
+FOR EACH ROW
+EXECUTE FUNCTION rollup_borrow();
+
+--Trigger2: Add each book sale to its day's bucket, priced like the revenue reports (current Books_for_Sale price)
+
+CREATE OR REPLACE FUNCTION rollup_book_sale()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE Daily_Book_Sales d
+        SET Quantity = GREATEST(d.Quantity - OLD.Quantity, 0),
+            Revenue = d.Revenue - OLD.Quantity * bfs.Price
+        FROM Books_for_Sale bfs
+        WHERE bfs.ISBN = OLD.ISBN
+        AND d.Day = OLD.Date_Time::DATE AND d.BranchID = OLD.BranchID AND d.ISBN = OLD.ISBN;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Daily_Book_Sales (Day, BranchID, ISBN, Quantity, Revenue)
+        SELECT NEW.Date_Time::DATE, NEW.BranchID, NEW.ISBN, NEW.Quantity, NEW.Quantity * bfs.Price
+        FROM Books_for_Sale bfs
+        WHERE bfs.ISBN = NEW.ISBN
+        ON CONFLICT (Day, BranchID, ISBN)
+        DO UPDATE SET Quantity = Daily_Book_Sales.Quantity + EXCLUDED.Quantity,
+                      Revenue = Daily_Book_Sales.Revenue + EXCLUDED.Revenue;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_rollup_book_sale ON Buys_Books;
+CREATE TRIGGER trigger_rollup_book_sale
+AFTER INSERT OR DELETE OR UPDATE OF Date_Time, BranchID, ISBN, Quantity ON Buys_Books
+FOR EACH ROW
+EXECUTE FUNCTION rollup_book_sale();
+
+--Trigger3: Add each item sale to its day's bucket
+
+CREATE OR REPLACE FUNCTION rollup_item_sale()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE Daily_Item_Sales d
+        SET Quantity = GREATEST(d.Quantity - OLD.Quantity, 0),
+            Revenue = d.Revenue - OLD.Quantity * i.Price
+        FROM Items i
+        WHERE i.Barcode = OLD.Barcode
+        AND d.Day = OLD.Date_Time::DATE AND d.BranchID = OLD.BranchID AND d.Barcode = OLD.Barcode;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Daily_Item_Sales (Day, BranchID, Barcode, Quantity, Revenue)
+        SELECT NEW.Date_Time::DATE, NEW.BranchID, NEW.Barcode, NEW.Quantity, NEW.Quantity * i.Price
+        FROM Items i
+        WHERE i.Barcode = NEW.Barcode
+        ON CONFLICT (Day, BranchID, Barcode)
+        DO UPDATE SET Quantity = Daily_Item_Sales.Quantity + EXCLUDED.Quantity,
+                      Revenue = Daily_Item_Sales.Revenue + EXCLUDED.Revenue;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_rollup_item_sale ON Purchases_Items;
+CREATE TRIGGER trigger_rollup_item_sale
+AFTER INSERT OR DELETE OR UPDATE OF Date_Time, BranchID, Barcode, Quantity ON Purchases_Items
+FOR EACH ROW
+EXECUTE FUNCTION rollup_item_sale();
+
+
+
+--FUNCTIONS:
+
+--Function1: Rebuild the buckets of a date range from the raw tables (idempotent; used for the initial backfill
+--and to repair buckets the triggers cannot follow: price changes, a rented copy moved to another branch,
+--or loads run with the triggers disabled)
+
+CREATE OR REPLACE FUNCTION refresh_daily_aggregates(from_date DATE, to_date DATE)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM Daily_Borrows WHERE Day BETWEEN from_date AND to_date;
+    INSERT INTO Daily_Borrows (Day, BranchID, ISBN, Borrow_Count)
+    SELECT b.Date_Out, COALESCE(br.BranchID, 'UNKNOWN'), br.ISBN, COUNT(*)
+    FROM Borrows b
+    JOIN Books_for_Rent br ON b.BookID = br.BookID
+    WHERE b.Date_Out BETWEEN from_date AND to_date
+    GROUP BY b.Date_Out, COALESCE(br.BranchID, 'UNKNOWN'), br.ISBN;
+
+    DELETE FROM Daily_Book_Sales WHERE Day BETWEEN from_date AND to_date;
+    INSERT INTO Daily_Book_Sales (Day, BranchID, ISBN, Quantity, Revenue)
+    SELECT bb.Date_Time::DATE, bb.BranchID, bb.ISBN, SUM(bb.Quantity), SUM(bb.Quantity * bfs.Price)
+    FROM Buys_Books bb
+    JOIN Books_for_Sale bfs ON bb.ISBN = bfs.ISBN
+    WHERE bb.Date_Time >= from_date AND bb.Date_Time < to_date + 1
+    GROUP BY bb.Date_Time::DATE, bb.BranchID, bb.ISBN;
+
+    DELETE FROM Daily_Item_Sales WHERE Day BETWEEN from_date AND to_date;
+    INSERT INTO Daily_Item_Sales (Day, BranchID, Barcode, Quantity, Revenue)
+    SELECT pi.Date_Time::DATE, pi.BranchID, pi.Barcode, SUM(pi.Quantity), SUM(pi.Quantity * i.Price)
+    FROM Purchases_Items pi
+    JOIN Items i ON pi.Barcode = i.Barcode
+    WHERE pi.Date_Time >= from_date AND pi.Date_Time < to_date + 1
+    GROUP BY pi.Date_Time::DATE, pi.BranchID, pi.Barcode;
+END;
+$$ LANGUAGE plpgsql;
+
+--Initial backfill:
+SELECT refresh_daily_aggregates('1900-01-01', CURRENT_DATE);
+
+
+
+--Example usage: weekly borrows per branch over the last quarter, answered from the buckets only
+SELECT date_trunc('week', Day)::DATE AS Period, BranchID, SUM(Borrow_Count) AS Borrow_Count
+FROM Daily_Borrows
+WHERE Day BETWEEN CURRENT_DATE - 90 AND CURRENT_DATE
+GROUP BY Period, BranchID
+ORDER BY Period, BranchID;
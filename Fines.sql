@@ -0,0 +1,228 @@
+--FINES: Incremental Daily Accrual of Overdue Penalties
+
+--The overdue report used to price every open loan at query time (Penalty + days late * 0.5), while
+--Customers_With_Penalties summed the stored Penalty, so the two disagreed about what a customer owes.
+--Now the fine is accrued into Borrows.Penalty by a nightly batch job: one set-based UPDATE advances every
+--overdue loan from the day it was last accrued (Fine_Accrued_Through) to the run date. Running it twice is a
+--no-op, and a missed night is caught up by the next run. Returning a book accrues its last days on the spot.
+--Per-customer totals are kept in Customer_Fines by statement-level triggers, so the penalties report is an
+--indexed lookup instead of an aggregate over all loans.
+--Run this script once, after create_table.sql and Views_Triggers_Functions_Procedures.sql (and Partitioning.sql if used).
+
+
+
+--FUNCTIONS:
+
+--Function1: The fine charged per overdue day
+
+CREATE OR REPLACE FUNCTION fine_daily_rate()
+RETURNS NUMERIC AS $$
+    SELECT 0.5::NUMERIC;
+$$ LANGUAGE sql IMMUTABLE;
+
+
+
+BEGIN;
+
+--TABLES:
+
+ALTER TABLE Borrows ADD COLUMN Fine_Accrued_Through DATE;   --NULL: nothing accrued yet (accrual starts at Due_Date)
+
+CREATE TABLE Customer_Fines (
+    Username VARCHAR(20) NOT NULL,
+    Total_Penalty NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    Updated_At TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    CONSTRAINT pk_Customer_Fines PRIMARY KEY (Username),
+    CONSTRAINT fk_Customer_Fines FOREIGN KEY (Username) REFERENCES Customer(Username)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idx_customer_fines_owing ON Customer_Fines (Total_Penalty DESC) WHERE Total_Penalty > 0;
+
+CREATE TABLE Fine_Accrual_Runs (
+    Run_Date DATE NOT NULL,
+    Loans_Updated INT NOT NULL,
+    Amount_Accrued NUMERIC(12, 2) NOT NULL,
+    Finished_At TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    CONSTRAINT pk_Fine_Accrual_Runs PRIMARY KEY (Run_Date, Finished_At)
+);
+
+--The overdue report and the accrual job both look for open loans past their due date
+CREATE INDEX IF NOT EXISTS idx_borrows_overdue ON Borrows (Due_Date) WHERE Status = 'Borrowed';
+
+--Initial totals, taken inside this transaction before the triggers below take over
+INSERT INTO Customer_Fines (Username, Total_Penalty)
+SELECT Username, SUM(Penalty)
+FROM Borrows
+GROUP BY Username;
+
+
+
+--TRIGGERS:
+
+--Trigger1: Keep Customer_Fines in step with every change to Borrows.Penalty, one aggregate per statement
+
+CREATE OR REPLACE FUNCTION sync_customer_fines()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO Customer_Fines (Username, Total_Penalty)
+        SELECT Username, SUM(COALESCE(Penalty, 0))
+        FROM new_rows
+        GROUP BY Username
+        ON CONFLICT (Username)
+        DO UPDATE SET Total_Penalty = Customer_Fines.Total_Penalty + EXCLUDED.Total_Penalty, Updated_At = now();
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO Customer_Fines (Username, Total_Penalty)
+        SELECT Username, SUM(Delta)
+        FROM (
+            SELECT Username, COALESCE(Penalty, 0) AS Delta FROM new_rows
+            UNION ALL
+            SELECT Username, -COALESCE(Penalty, 0) FROM old_rows
+        ) d
+        GROUP BY Username
+        HAVING SUM(Delta) <> 0
+        ON CONFLICT (Username)
+        DO UPDATE SET Total_Penalty = Customer_Fines.Total_Penalty + EXCLUDED.Total_Penalty, Updated_At = now();
+    ELSE
+        UPDATE Customer_Fines f
+        SET Total_Penalty = f.Total_Penalty - d.Removed, Updated_At = now()
+        FROM (
+            SELECT Username, SUM(COALESCE(Penalty, 0)) AS Removed
+            FROM old_rows
+            GROUP BY Username
+        ) d
+        WHERE f.Username = d.Username;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+--Transition tables allow only one event per trigger
+CREATE TRIGGER trigger_sync_customer_fines_insert
+AFTER INSERT ON Borrows
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_customer_fines();
+
+CREATE TRIGGER trigger_sync_customer_fines_update
+AFTER UPDATE ON Borrows
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_customer_fines();
+
+CREATE TRIGGER trigger_sync_customer_fines_delete
+AFTER DELETE ON Borrows
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_customer_fines();
+
+--Trigger2: When a loan is returned, charge the days since the last accrual so the fine is final
+
+CREATE OR REPLACE FUNCTION accrue_fine_on_return()
+RETURNS TRIGGER AS $$
+DECLARE
+    accrued_from DATE := GREATEST(COALESCE(OLD.Fine_Accrued_Through, OLD.Due_Date), OLD.Due_Date);
+BEGIN
+    IF CURRENT_DATE > accrued_from THEN
+        NEW.Penalty := COALESCE(NEW.Penalty, 0) + (CURRENT_DATE - accrued_from) * fine_daily_rate();
+        NEW.Fine_Accrued_Through := CURRENT_DATE;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_accrue_fine_on_return
+BEFORE UPDATE OF Status ON Borrows
+FOR EACH ROW
+WHEN (OLD.Status = 'Borrowed' AND NEW.Status = 'Returned')
+EXECUTE FUNCTION accrue_fine_on_return();
+
+
+
+--VIEWS:
+
+--The penalties view now reads the maintained totals
+DROP VIEW Customers_With_Penalties;
+CREATE VIEW Customers_With_Penalties AS
+SELECT
+    c.Username,
+    c.First_Name,
+    c.Last_Name,
+    f.Total_Penalty
+FROM
+    Customer_Fines f
+JOIN
+    Customer c ON f.Username = c.Username
+WHERE
+    f.Total_Penalty > 0
+ORDER BY
+    f.Total_Penalty DESC;
+
+COMMIT;
+
+
+
+--FUNCTIONS:
+
+--Function2: The batch job. Advances every overdue open loan's fine up to run_date in one statement and
+--logs the run. Idempotent for a given date; after missed days it charges all of them at once.
+
+CREATE OR REPLACE FUNCTION accrue_fines(run_date DATE DEFAULT CURRENT_DATE)
+RETURNS INT AS $$
+DECLARE
+    loans_updated INT;
+    days_charged INT;
+BEGIN
+    WITH due AS (
+        SELECT Username, BookID, Date_Out,
+               run_date - GREATEST(COALESCE(Fine_Accrued_Through, Due_Date), Due_Date) AS Days
+        FROM Borrows
+        WHERE Status = 'Borrowed'
+        AND Due_Date < run_date
+        AND COALESCE(Fine_Accrued_Through, Due_Date) < run_date
+    ),
+    accrued AS (
+        UPDATE Borrows b
+        SET Penalty = COALESCE(b.Penalty, 0) + d.Days * fine_daily_rate(),
+            Fine_Accrued_Through = run_date
+        FROM due d
+        WHERE b.Username = d.Username AND b.BookID = d.BookID AND b.Date_Out = d.Date_Out
+        AND COALESCE(b.Fine_Accrued_Through, b.Due_Date) < run_date   --skip loans accrued concurrently
+        RETURNING d.Days
+    )
+    SELECT COUNT(*), COALESCE(SUM(Days), 0) INTO loans_updated, days_charged
+    FROM accrued;
+
+    INSERT INTO Fine_Accrual_Runs (Run_Date, Loans_Updated, Amount_Accrued)
+    VALUES (run_date, loans_updated, days_charged * fine_daily_rate());
+
+    RETURN loans_updated;
+END;
+$$ LANGUAGE plpgsql;
+
+--Initial run: brings every overdue loan up to today
+SELECT accrue_fines();
+
+
+
+--Scheduling: accrue every night shortly after midnight (requires the pg_cron extension)
+--CREATE EXTENSION pg_cron;
+--SELECT cron.schedule('libtech-fines', '5 0 * * *', 'SELECT accrue_fines()');
+--Without pg_cron, any scheduler can run: psql -c "SELECT accrue_fines();"
+
+
+
+--Example usage:
+
+--Catch-up is automatic; this returns 0 when tonight's run already happened
+SELECT accrue_fines();
+
+--History of the job
+SELECT * FROM Fine_Accrual_Runs ORDER BY Finished_At DESC;
+
+--Top debtors straight from the maintained totals
+SELECT * FROM Customers_With_Penalties;
@@ -0,0 +1,42 @@
+--PARTITIONING BENCHMARK: 10M loans spread over 10 years
+
+--Scratch script: it inserts 10M generated loans into Borrows. Run it only on a disposable copy of the
+--database, after Partitioning.sql, never on the production database.
+
+
+
+--The user triggers (stock, overdue rule, audit log, fines) are disabled during the load so the generated rows
+--do not have to respect the business rules.
+ALTER TABLE Borrows DISABLE TRIGGER USER;
+SELECT create_monthly_partitions('borrows', (CURRENT_DATE - INTERVAL '10 years')::DATE, CURRENT_DATE);
+
+INSERT INTO Borrows (Username, BookID, Date_Out, Due_Date, Penalty, Status)
+SELECT
+    c.Username,
+    r.BookID,
+    d.Date_Out,
+    d.Date_Out + 14,
+    0,
+    'Returned'
+FROM generate_series(1, 10000000) g
+CROSS JOIN LATERAL (SELECT (CURRENT_DATE - (g % 3650))::DATE AS Date_Out) d
+JOIN LATERAL (SELECT Username FROM Customer OFFSET g % (SELECT COUNT(*) FROM Customer) LIMIT 1) c ON TRUE
+JOIN LATERAL (SELECT BookID FROM Books_for_Rent OFFSET g % (SELECT COUNT(*) FROM Books_for_Rent) LIMIT 1) r ON TRUE
+ON CONFLICT DO NOTHING;
+
+ALTER TABLE Borrows ENABLE TRIGGER USER;
+ANALYZE Borrows;
+
+--"Top 5 Borrowed Books in the Last Year" on the partitioned table
+EXPLAIN (ANALYZE, COSTS OFF)
+SELECT br.Title, COUNT(b.BookID) AS Borrow_Count
+FROM Borrows b
+JOIN Books_for_Rent br ON b.BookID = br.BookID
+WHERE b.Date_Out >= CURRENT_DATE - INTERVAL '1 year'
+GROUP BY br.Title
+ORDER BY Borrow_Count DESC
+LIMIT 5;
+
+--Compare its "Execution Time" with the same query on an unpartitioned copy:
+--CREATE TABLE Borrows_Flat AS SELECT * FROM Borrows; CREATE INDEX ON Borrows_Flat (Date_Out); ANALYZE Borrows_Flat;
+--The partitioned plan should read roughly a tenth of the pages (12 of ~120 monthly partitions).
@@ -0,0 +1,22 @@
+--RECOMMENDATIONS: Top-K Book Neighbours
+
+--Item-to-item recommendations ("patrons who borrowed this also borrowed...") computed in batch by
+--rebuild_book_neighbours() in app.py from the customer x ISBN history in Borrows and Buys_Books.
+--Only the K best neighbours of each ISBN are kept, so the app can hold the whole table in memory.
+
+CREATE TABLE Book_Neighbours (
+    ISBN CHAR(13) NOT NULL,
+    Neighbour_ISBN CHAR(13) NOT NULL,
+    Score REAL NOT NULL CHECK (Score > 0),   --cosine similarity of the two ISBNs' customer sets
+    Rank SMALLINT NOT NULL CHECK (Rank > 0),
+
+    CONSTRAINT pk_Book_Neighbours PRIMARY KEY (ISBN, Rank)
+);
+
+
+--Example usage: books most often borrowed or bought together with a given ISBN
+SELECT n.Rank, n.Neighbour_ISBN, b.Title, n.Score
+FROM Book_Neighbours n
+LEFT JOIN Books_for_Sale b ON b.ISBN = n.Neighbour_ISBN
+WHERE n.ISBN = '0000000002431'
+ORDER BY n.Rank;
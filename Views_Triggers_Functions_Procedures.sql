@@ -99,14 +99,20 @@ DECLARE
     branch_id VARCHAR(10);
     existing_price NUMERIC;  -- To store the price of the existing book, if found
 BEGIN
+    -- Rows written by bulk_sale_to_rent have already been converted in one set-based pass
+    IF current_setting('libtech.bulk_sale_to_rent', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+
     -- Step 1: Extract Shelf_No and Row_No from BookID
     shelf_no := CAST(SUBSTRING(NEW.BookID FROM POSITION('#' IN NEW.BookID) + 1 FOR 2) AS INT);
     row_no := CAST(SUBSTRING(NEW.BookID FROM POSITION('#' IN NEW.BookID) + 3 FOR 1) AS INT);
 
-    -- Step 2: Get the BranchID from Stores_Booksforsale table
+    -- Step 2: Get the BranchID from Stores_Booksforsale table (the branch holding the most copies, so the choice is deterministic)
     SELECT BranchID INTO branch_id
     FROM Stores_Booksforsale
     WHERE ISBN = NEW.ISBN
+    ORDER BY Number_of_Copies DESC, BranchID
     LIMIT 1;
 
     -- Check if a valid branch was found
@@ -272,6 +278,100 @@ $$;
 --example: CALL transfer_book_stock('LIBTECH01', 'LIBTECH02', '0000000003421', 5);
 
 
+--Stored Procedure2: Convert a batch of copies from sale to rent in one branch
+
+--Set-based alternative to inserting into Sale_to_Rent row by row: each BookID (format ISBN#ID) is taken from the
+--given branch's stock, and the price, stock decrement and Books_for_Rent insert are resolved with joins for the
+--whole batch in a single transaction. Nothing is changed if any copy cannot be converted.
+
+CREATE OR REPLACE PROCEDURE bulk_sale_to_rent(
+    branch_id VARCHAR,
+    book_ids TEXT[],
+    move_date DATE DEFAULT CURRENT_DATE,
+    move_discount NUMERIC DEFAULT 0
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    problem TEXT;
+BEGIN
+    -- Parse every BookID the same way handle_sale_to_rent does
+    CREATE TEMP TABLE Bulk_Moves ON COMMIT DROP AS
+    SELECT DISTINCT
+        m.BookID,
+        split_part(m.BookID, '#', 1)::CHAR(13) AS ISBN,
+        CAST(SUBSTRING(m.BookID FROM POSITION('#' IN m.BookID) + 1 FOR 2) AS INT) AS Shelf_No,
+        CAST(SUBSTRING(m.BookID FROM POSITION('#' IN m.BookID) + 3 FOR 1) AS INT) AS Row_No
+    FROM unnest(book_ids) AS m(BookID);
+
+    SELECT string_agg(m.BookID, ', ') INTO problem
+    FROM Bulk_Moves m
+    JOIN Books_for_Rent r ON r.BookID = m.BookID;
+    IF problem IS NOT NULL THEN
+        RAISE EXCEPTION 'Book IDs already for rent: %', problem;
+    END IF;
+
+    -- Lock the branch's stock rows, then check every ISBN has enough copies for the batch
+    PERFORM 1
+    FROM Stores_Booksforsale
+    WHERE BranchID = branch_id AND ISBN IN (SELECT ISBN FROM Bulk_Moves)
+    FOR UPDATE;
+
+    SELECT string_agg(format('%s (need %s, have %s)', n.ISBN, n.Needed, COALESCE(s.Number_of_Copies, 0)), ', ') INTO problem
+    FROM (SELECT ISBN, COUNT(*) AS Needed FROM Bulk_Moves GROUP BY ISBN) n
+    LEFT JOIN Stores_Booksforsale s ON s.ISBN = n.ISBN AND s.BranchID = branch_id
+    WHERE COALESCE(s.Number_of_Copies, 0) < n.Needed;
+    IF problem IS NOT NULL THEN
+        RAISE EXCEPTION 'Not enough copies for sale in branch %: %', branch_id, problem;
+    END IF;
+
+    UPDATE Stores_Booksforsale s
+    SET Number_of_Copies = s.Number_of_Copies - n.Needed
+    FROM (SELECT ISBN, COUNT(*) AS Needed FROM Bulk_Moves GROUP BY ISBN) n
+    WHERE s.BranchID = branch_id AND s.ISBN = n.ISBN;
+
+    -- Reuse the rent price of existing copies of the ISBN, otherwise discount the sale price
+    INSERT INTO Books_for_Rent (
+        BookID, ISBN, Title, Genre, Price, Translator, Edition, Pages, Lang, Publisher_Name, Shelf_No, Row_No, BranchID
+    )
+    SELECT
+        m.BookID,
+        b.ISBN,
+        b.Title,
+        b.Genre,
+        COALESCE(r.Price, ROUND(b.Price * (1 - move_discount / 100.0), 2)),
+        b.Translator,
+        b.Edition,
+        b.Pages,
+        b.Lang,
+        b.Publisher_Name,
+        m.Shelf_No,
+        m.Row_No,
+        branch_id
+    FROM Bulk_Moves m
+    JOIN Books_for_Sale b ON b.ISBN = m.ISBN
+    LEFT JOIN (
+        SELECT ISBN, MIN(Price) AS Price
+        FROM Books_for_Rent
+        WHERE ISBN IN (SELECT ISBN FROM Bulk_Moves)
+        GROUP BY ISBN
+    ) r ON r.ISBN = m.ISBN;
+
+    -- Record the moves without running the per-row trigger again
+    PERFORM set_config('libtech.bulk_sale_to_rent', 'on', true);
+    INSERT INTO Sale_to_Rent (BookID, ISBN, Date_Moved, Discount)
+    SELECT BookID, ISBN, move_date, move_discount
+    FROM Bulk_Moves;
+    PERFORM set_config('libtech.bulk_sale_to_rent', 'off', true);
+
+    DROP TABLE Bulk_Moves;
+END;
+$$;
+
+
+--example: CALL bulk_sale_to_rent('LIBTECH01', ARRAY['0000000003421#121', '0000000003421#122'], CURRENT_DATE, 10);
+
+
 
 
 
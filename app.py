@@ -1,12 +1,37 @@
 # app.py
 
+import bisect
+import hashlib
+import heapq
+import io
+import json
+import logging
+import multiprocessing
+import re
+import secrets
+import select
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import streamlit as st
+import duckdb
+import numpy as np
 import pandas as pd
 import psycopg2
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import os
+from compute import (
+    FORECAST_MONTHS, build_book_neighbours, forecast_rental_demand, score_customers,
+)
 
 # ---------------------------#
 #         Page Config         #
@@ -14,97 +39,1923 @@ import os
 
 st.set_page_config(page_title="📚 LibTech Database", layout="wide")
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------#
 #       Database Setup        #
 # ---------------------------#
 
-#TO BE CHANGED ACCORDING TO EACH PERSON'S.
+# Connection settings are read from the [postgres] section of .streamlit/secrets.toml,
+# then from DB_* environment variables, then from the local defaults below.
+# An optional read replica is configured the same way through [postgres_replica] / DB_REPLICA_*.
+
+DEFAULT_DB_SETTINGS = {
+    "host": "127.0.0.1",
+    "port": "5432",
+    "dbname": "xxx",
+    "user": "xxx",
+    "password": "xxx",
+}
+DEFAULT_ENCRYPTION_KEY = "s3cUr3!kEy#2023@P0stgreSQL^"
+
+READ_YOUR_WRITES_SECONDS = 30   # keep a session's reads on the primary this long after it writes
+MAX_REPLICA_LAG_SECONDS = 10    # route reads back to the primary when the replica falls further behind
+
+# Statement timeouts per query class: circulation (logins, lookups, Add Data writes) must stay responsive,
+# reports may run longer, and staff batch jobs longer still
+STATEMENT_TIMEOUTS = {"circulation": "5s", "analytics": "30s", "batch": "10min"}
+ANALYTICS_MAX_CONCURRENT = 4    # reports running at once per process; circulation has its own connection
+ANALYTICS_QUEUE_SECONDS = 10    # how long a report waits for a free slot before it is shed
+
+def read_secrets_section(name):
+    """
+    Returns a section of st.secrets as a dict, or an empty dict when no secrets file is present.
+    """
+    try:
+        return dict(st.secrets.get(name, {}))
+    except Exception:
+        return {}
+
+def load_db_settings(section, env_prefix, defaults):
+    """
+    Resolves connection settings for one database from secrets, environment variables and defaults.
+    Returns None if no host is configured anywhere.
+    """
+    secrets_section = read_secrets_section(section)
+    settings = {}
+    for key in ("host", "port", "dbname", "user", "password"):
+        env_key = env_prefix + ("NAME" if key == "dbname" else key.upper())
+        settings[key] = secrets_section.get(key) or os.environ.get(env_key) or defaults.get(key)
+    return settings if settings["host"] else None
 
-DB_HOST = "127.0.0.1"
-DB_PORT = "5432"
-DB_NAME = "xxx"
-DB_USER = "xxx"
-DB_PASSWORD = "xxx"
-ENCRYPTION_KEY = "s3cUr3!kEy#2023@P0stgreSQL^"
+DB_SETTINGS = load_db_settings("postgres", "DB_", DEFAULT_DB_SETTINGS)
+REPLICA_SETTINGS = load_db_settings("postgres_replica", "DB_REPLICA_", {})
+ENCRYPTION_KEY = (
+    read_secrets_section("app").get("encryption_key")
+    or os.environ.get("ENCRYPTION_KEY")
+    or DEFAULT_ENCRYPTION_KEY
+)
 
 @st.cache_resource
-def get_connection():
+def get_connection(target="primary"):
     """
-    Establishes a connection to the PostgreSQL database using provided credentials.
+    Establishes a connection to the primary PostgreSQL database, or to the read replica when
+    target is "replica". Returns None if the target is not configured or cannot be reached.
+    The primary connection serves circulation and the replica serves reports, each with its class's timeout.
     """
+    settings = DB_SETTINGS if target == "primary" else REPLICA_SETTINGS
+    if settings is None:
+        return None
+    query_class = "circulation" if target == "primary" else "analytics"
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
+        conn = psycopg2.connect(**settings, options=f"-c statement_timeout={STATEMENT_TIMEOUTS[query_class]}")
+        if target == "replica":
+            # Reads only: avoid holding snapshots open on the standby between reruns
+            conn.autocommit = True
         return conn
     except Exception as e:
-        st.error(f"Error connecting to the database: {e}")
+        st.error(f"Error connecting to the {target} database: {e}")
         return None
 
 conn = get_connection()
+replica_conn = get_connection("replica")
+
+@st.cache_data(ttl=5)
+def replica_lag_seconds():
+    """
+    Returns how far the replica's replay is behind the primary in seconds, or None if unknown.
+    """
+    if replica_conn is None:
+        return None
+    try:
+        with replica_conn.cursor() as cur:
+            cur.execute("""
+                SELECT CASE
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                END;
+            """)
+            lag = cur.fetchone()[0]
+            return float(lag) if lag is not None else None
+    except Exception:
+        return None
+
+def wrote_recently():
+    """
+    True for READ_YOUR_WRITES_SECONDS after this session wrote: its reads must then see the primary's data.
+    """
+    last_write = st.session_state.get("last_write_at")
+    return last_write is not None and time.monotonic() - last_write < READ_YOUR_WRITES_SECONDS
+
+def replica_usable():
+    """
+    Reports go to the replica only when it is configured, this session has not written recently,
+    and the replica is within MAX_REPLICA_LAG_SECONDS.
+    """
+    if replica_conn is None or wrote_recently():
+        return False
+    lag = replica_lag_seconds()
+    return lag is not None and lag <= MAX_REPLICA_LAG_SECONDS
+
+@st.cache_resource
+def get_analytics_pool():
+    """
+    Opens the pool of primary connections used by reports when the replica is not, kept apart from
+    the circulation connection so writes never queue behind a long report.
+    """
+    if DB_SETTINGS is None:
+        return None
+    try:
+        return ThreadedConnectionPool(
+            1, ANALYTICS_MAX_CONCURRENT, **DB_SETTINGS,
+            options=f"-c statement_timeout={STATEMENT_TIMEOUTS['analytics']}"
+        )
+    except Exception as e:
+        st.error(f"Error opening the analytics connection pool: {e}")
+        return None
+
+@contextmanager
+def analytics_connection(fresh=False):
+    """
+    Lends a connection for one report: the replica when usable (and fresh is not requested),
+    otherwise a pooled primary connection.
+    """
+    if not fresh and replica_usable():
+        yield replica_conn
+        return
+    pool = get_analytics_pool()
+    if pool is None:
+        raise psycopg2.OperationalError("No database connection.")
+    read_conn = pool.getconn()
+    try:
+        # Reads only: no transaction is left open between reports
+        read_conn.autocommit = True
+        yield read_conn
+    finally:
+        pool.putconn(read_conn, close=bool(read_conn.closed))
+
+# ---------------------------#
+#    Multi-Process Serving    #
+# ---------------------------#
+
+# serve.py runs several copies of this app behind a load balancer. Report results are then shared between
+# the processes as Arrow IPC files in SHARED_CACHE_DIR, and CPU-bound post-processing (compute.py) can run
+# in a pool of CPU_WORKERS processes so it does not hold the web process's GIL. Both are off by default.
+SHARED_CACHE_DIR = os.environ.get("LIBTECH_SHARED_CACHE_DIR")
+SHARED_CACHE_MAX_AGE_SECONDS = 120   # entries also expire when a table they read changes (see shared_cache_key)
+SHARED_CACHE_MAX_BYTES = 1 << 30     # oldest entries are deleted beyond this size
+SHARED_CACHE_PRUNE_EVERY = 50        # writes between size checks
+CPU_WORKERS = int(os.environ.get("LIBTECH_CPU_WORKERS", "0"))
+
+class SharedResultCache:
+    """
+    Report results shared by all app processes on this host, one Arrow IPC file per result. Files are
+    written to a temporary name and renamed into place, and read through a memory map, so readers never
+    see partial files and several processes can read one entry without copying it into each process first.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".arrow")
+
+    def get(self, key):
+        """
+        Returns the cached Arrow table, or None if there is no entry or it is older than SHARED_CACHE_MAX_AGE_SECONDS.
+        The table's buffers point into the mapped file; they stay valid if the file is replaced or pruned.
+        """
+        path = self.path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > SHARED_CACHE_MAX_AGE_SECONDS:
+                return None
+            with pa.memory_map(path) as source:
+                return pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def put(self, key, table):
+        """
+        Stores an Arrow table; results over STALE_RESULT_MAX_ROWS are skipped.
+        """
+        if table.num_rows > STALE_RESULT_MAX_ROWS:
+            return
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.writes += 1
+        if self.writes % SHARED_CACHE_PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Deletes expired entries, then the oldest ones until the directory is under SHARED_CACHE_MAX_BYTES.
+        """
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".arrow"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= SHARED_CACHE_MAX_AGE_SECONDS and total <= SHARED_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+@st.cache_resource
+def get_shared_cache():
+    if not SHARED_CACHE_DIR:
+        return None
+    return SharedResultCache(SHARED_CACHE_DIR)
+
+def query_text(_query):
+    """
+    Returns the SQL text of a query given as a string or as psycopg2.sql objects (without a connection).
+    """
+    if isinstance(_query, sql.Composed):
+        return "".join(query_text(part) for part in _query.seq)
+    if isinstance(_query, sql.SQL):
+        return _query.string
+    if isinstance(_query, sql.Identifier):
+        return ".".join(_query.strings)
+    return str(_query)
+
+def shared_cache_key(_query, params):
+    """
+    Keys a result by its query, parameters and the change-feed versions of the tables it reads, so a
+    write to any of them (seen by any process) makes the old entry unreachable.
+    """
+    text = query_text(_query)
+    feed = get_change_feed()
+    versions = tuple(feed.version(t) for t in report_tables(text)) if feed is not None else ()
+    return repr((text, repr(params), versions))
+
+@st.cache_resource
+def get_process_pool():
+    """
+    Starts the pool running compute.py functions, or returns None to run them in this process.
+    Workers are spawned rather than forked: this process already runs database and feed threads.
+    """
+    if CPU_WORKERS <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def offload(fn, *args):
+    """
+    Runs a compute.py function in the process pool when one is configured, otherwise in this process.
+    """
+    pool = get_process_pool()
+    if pool is None:
+        return fn(*args)
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a new pool next time and do this one here
+        get_process_pool.clear()
+        return fn(*args)
+
+# ---------------------------#
+#     Report Load Control     #
+# ---------------------------#
+
+BREAKER_WINDOW_SECONDS = 60     # report outcomes considered when deciding to trip
+BREAKER_MIN_FAILURES = 5        # trip only after this many failures in the window...
+BREAKER_FAILURE_RATE = 0.5      # ...that are at least this share of the window's reports
+BREAKER_COOLDOWN_SECONDS = 30   # wait this long before letting a trial report through
+STALE_RESULTS_SIZE = 200        # last good results kept per process to serve while tripped
+STALE_RESULT_MAX_ROWS = 100_000 # larger results are not kept
+
+class CircuitBreaker:
+    """
+    Process-wide guard for report queries. It opens when failures (errors, timeouts and shed reports)
+    spike, and reports are then answered from the last good result of the same query. After
+    BREAKER_COOLDOWN_SECONDS one trial report is let through; its outcome closes or reopens the breaker.
+    Circulation queries and writes never pass through it.
+    """
+    def __init__(self):
+        self.outcomes = deque()         # (monotonic time, succeeded) within the window
+        self.opened_at = None
+        self.trial_running = False
+        self.last_good = OrderedDict()  # query key -> (fetched at, Arrow table)
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial_running and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_SECONDS:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, succeeded):
+        with self.lock:
+            now = time.monotonic()
+            if self.trial_running:
+                self.trial_running = False
+                self.opened_at = None if succeeded else now
+                self.outcomes.clear()
+                return
+            self.outcomes.append((now, succeeded))
+            while now - self.outcomes[0][0] > BREAKER_WINDOW_SECONDS:
+                self.outcomes.popleft()
+            failures = sum(1 for _, ok in self.outcomes if not ok)
+            if failures >= BREAKER_MIN_FAILURES and failures >= BREAKER_FAILURE_RATE * len(self.outcomes):
+                self.opened_at = now
+
+    def remember(self, key, table):
+        if table.num_rows > STALE_RESULT_MAX_ROWS:
+            return
+        with self.lock:
+            self.last_good[key] = (datetime.now(), table)
+            self.last_good.move_to_end(key)
+            while len(self.last_good) > STALE_RESULTS_SIZE:
+                self.last_good.popitem(last=False)
+
+    def stale(self, key):
+        with self.lock:
+            return self.last_good.get(key)
+
+@st.cache_resource
+def get_circuit_breaker():
+    return CircuitBreaker()
+
+@st.cache_resource
+def get_analytics_limiter():
+    return threading.BoundedSemaphore(ANALYTICS_MAX_CONCURRENT)
+
+def serve_stale(key, reason, stale_ok=True):
+    """
+    Returns the last good result of a report with a "stale" banner, or an empty table and an error.
+    With stale_ok=False it only shows the error and returns None.
+    """
+    if not stale_ok:
+        st.error(reason)
+        return None
+    stale = get_circuit_breaker().stale(key)
+    if stale is None:
+        st.error(f"{reason} No earlier result is available; please try again shortly.")
+        return pa.table({})
+    fetched_at, table = stale
+    st.warning(f"⚠️ Stale results from {fetched_at:%Y-%m-%d %H:%M:%S}. {reason}")
+    return table
+
+def run_analytics_table(_query, params=None, fresh=False, stale_ok=True):
+    """
+    Runs a report query under the analytics timeout and concurrency cap, through the circuit breaker,
+    and returns the result as an Arrow table (which st.dataframe displays without converting it).
+    Results are shared with the other app processes when a shared cache is configured.
+    Set fresh to read from the primary, e.g. right after a change notification, and stale_ok=False
+    to get None instead of the last good result when the query cannot run.
+    """
+    shared = get_shared_cache()
+    if shared is not None:
+        shared_key = shared_cache_key(_query, params)
+        if not fresh and not wrote_recently():
+            table = shared.get(shared_key)
+            if table is not None:
+                return table
+    breaker = get_circuit_breaker()
+    key = (repr(_query), repr(params))
+    if not breaker.allow():
+        return serve_stale(key, "Reports are paused while the database recovers.", stale_ok)
+    limiter = get_analytics_limiter()
+    if not limiter.acquire(timeout=ANALYTICS_QUEUE_SECONDS):
+        breaker.record(False)
+        return serve_stale(key, "The database is busy with other reports.", stale_ok)
+    try:
+        with analytics_connection(fresh) as read_conn:
+            table = fetch_table(read_conn, _query, params)
+    except Exception as e:
+        breaker.record(False)
+        return serve_stale(key, f"Error executing query: {e}", stale_ok)
+    finally:
+        limiter.release()
+    breaker.record(True)
+    breaker.remember(key, table)
+    if shared is not None:
+        shared.put(shared_key, table)
+    return table
+
+def run_analytics_query(_query, params=None, fresh=False):
+    """
+    Same as run_analytics_table, as a pandas DataFrame.
+    """
+    return run_analytics_table(_query, params, fresh).to_pandas()
 
 # ---------------------------#
 #       Helper Functions      #
 # ---------------------------#
 
-def run_query(_query, params=None):
+# Arrow types for the PostgreSQL result types (by type OID) that reports return; others are read as text.
+# NUMERIC becomes float64, as the charts and computations use it anyway.
+PG_ARROW_TYPES = {
+    16: pa.bool_(),                        # boolean
+    20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+    700: pa.float32(), 701: pa.float64(), 1700: pa.float64(),
+    1082: pa.date32(),                     # date
+    1114: pa.timestamp("us"),              # timestamp
+    1184: pa.timestamp("us", tz="UTC"),    # timestamptz
+}
+RESULT_SCHEMAS_SIZE = 500   # result column types remembered per process, by query text
+
+@st.cache_resource
+def get_result_schemas():
+    return OrderedDict()
+
+def result_schema(cur, _query, statement):
+    """
+    Returns the Arrow schema of a query's result, from the column types of a LIMIT 0 run the first time.
+    """
+    schemas = get_result_schemas()
+    key = query_text(_query)
+    schema = schemas.get(key)
+    if schema is None:
+        cur.execute(f"SELECT * FROM (\n{statement}\n) AS q LIMIT 0;")
+        schema = pa.schema([(col.name, PG_ARROW_TYPES.get(col.type_code, pa.string())) for col in cur.description])
+        schemas[key] = schema
+        while len(schemas) > RESULT_SCHEMAS_SIZE:
+            schemas.popitem(last=False)
+    return schema
+
+def fetch_table(read_conn, _query, params=None):
+    """
+    Reads a query's result straight into an Arrow table: the server streams it as CSV through COPY and
+    Arrow's parser builds typed columns from it, without a Python object per row or per value.
+    Statements COPY cannot run, and results Arrow cannot parse, are read through fetch_dataframe instead.
+    """
+    with read_conn.cursor() as cur:
+        statement = cur.mogrify(_query, params).decode(psycopg2.extensions.encodings[read_conn.encoding])
+        statement = statement.strip().rstrip(";")
+        try:
+            schema = result_schema(cur, _query, statement)
+            if len(set(schema.names)) < len(schema.names):
+                # Arrow needs distinct column names to assign the types
+                return frame_to_table(fetch_dataframe(read_conn, _query, params))
+            buffer = io.BytesIO()
+            cur.copy_expert(f"COPY (\n{statement}\n) TO STDOUT WITH (FORMAT csv)", buffer)
+        except psycopg2.ProgrammingError:
+            return frame_to_table(fetch_dataframe(read_conn, _query, params))
+    if buffer.tell() == 0:
+        return schema.empty_table()
+    buffer.seek(0)
+    try:
+        return pa_csv.read_csv(
+            buffer,
+            read_options=pa_csv.ReadOptions(column_names=schema.names),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),   # text values may span lines
+            convert_options=pa_csv.ConvertOptions(
+                column_types=dict(zip(schema.names, schema.types)),
+                null_values=[""],                  # COPY writes NULL as an empty field and '' as ""
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+                true_values=["t"],
+                false_values=["f"],
+            ),
+        )
+    except pa.ArrowInvalid:
+        # e.g. 'infinity' timestamps, or a schema remembered from before the table changed
+        get_result_schemas().pop(query_text(_query), None)
+        return frame_to_table(fetch_dataframe(read_conn, _query, params))
+
+def frame_to_table(df):
+    """
+    Converts a DataFrame to an Arrow table with the same types fetch_table produces: Decimal columns
+    become float64 (as NUMERIC does there), text is string, and columns of mixed Python types are read as text.
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        mixed = df.select_dtypes(include="object").columns
+        table = pa.Table.from_pandas(df.astype({col: str for col in mixed}), preserve_index=False)
+    same_types = {pa.types.is_decimal: pa.float64(), pa.types.is_large_string: pa.string()}
+    return table.cast(pa.schema([
+        next((pa.field(f.name, t) for test, t in same_types.items() if test(f.type)), f) for f in table.schema
+    ]))
+
+def fetch_dataframe(read_conn, _query, params=None):
+    with read_conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(_query, params)
+        records = cur.fetchall()
+        if records:
+            df = pd.DataFrame(records)
+        else:
+            df = pd.DataFrame()
+        return df
+
+def run_query(_query, params=None, replica_ok=False):
     """
     Executes a SQL query and returns the result as a pandas DataFrame.
+    Set replica_ok for report reads: they may be served by the read replica and run as the analytics
+    query class (see run_analytics_query); other reads share the circulation connection.
     """
+    if replica_ok:
+        return run_analytics_query(_query, params)
     if conn is None:
         st.error("No database connection.")
         return pd.DataFrame()
     
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(_query, params)
-            records = cur.fetchall()
-            if records:
-                df = pd.DataFrame(records)
-            else:
-                df = pd.DataFrame()
-            return df
+        return fetch_dataframe(conn, _query, params)
     except Exception as e:
         st.error(f"Error executing query: {e}")
+        conn.rollback()
         return pd.DataFrame()
 
+def set_change_actor(cur):
+    """
+    Tags the current transaction with the logged-in user so Change_Events records who made each change.
+    """
+    identity = current_identity()
+    cur.execute("SELECT set_config('libtech.app_user', %s, true);", (identity["email"] if identity else "",))
+
 def execute_query(query, params=None, suppress_success=False):
     """
     Executes a SQL query that does not return data (e.g., CREATE, INSERT, UPDATE).
     Optionally suppresses the success message.
+    Returns True if the operation was committed, False otherwise.
     """
     if conn is None:
         st.error("No database connection.")
-        return
+        return False
     try:
         with conn.cursor() as cur:
+            set_change_actor(cur)
             cur.execute(query, params)
             conn.commit()
+        st.session_state["last_write_at"] = time.monotonic()
         if not suppress_success:
             st.success("Operation executed successfully.")
+        return True
     except Exception as e:
         st.error(f"Error executing operation: {e}")
         conn.rollback()
+        return False
 
 def call_procedure(proc_name, params):
     """
     Calls a stored procedure with the given name and parameters.
+    Returns True if the procedure completed and was committed, False otherwise.
     """
     if conn is None:
         st.error("No database connection.")
-        return
+        return False
     try:
+        # Procedures must be invoked with CALL; cursor.callproc() issues SELECT, which only works for functions
+        call_sql = sql.SQL("CALL {}({})").format(
+            sql.Identifier(proc_name),
+            sql.SQL(", ").join(sql.Placeholder() * len(params))
+        )
         with conn.cursor() as cur:
-            cur.callproc(proc_name, params)
+            set_change_actor(cur)
+            cur.execute(call_sql, params)
             conn.commit()
+        st.session_state["last_write_at"] = time.monotonic()
         st.success(f"Procedure '{proc_name}' executed successfully.")
+        return True
     except Exception as e:
         st.error(f"Error executing procedure '{proc_name}': {e}")
         conn.rollback()
+        return False
+
+def execute_transaction(statements):
+    """
+    Executes a list of (query, params) pairs in order as a single transaction with one commit.
+    Either every statement is applied or, if any fails, none of them are.
+    Returns True if the transaction was committed, False otherwise.
+    """
+    if conn is None:
+        st.error("No database connection.")
+        return False
+    position = 0
+    try:
+        with conn.cursor() as cur:
+            set_change_actor(cur)
+            for position, (query, params) in enumerate(statements, start=1):
+                cur.execute(query, params)
+            conn.commit()
+        st.session_state["last_write_at"] = time.monotonic()
+        st.success(f"Committed {len(statements)} change(s) in one transaction.")
+        return True
+    except Exception as e:
+        st.error(f"Error in change {position} of {len(statements)}; nothing was saved: {e}")
+        conn.rollback()
+        return False
+
+# ---------------------------#
+#         Change Feed         #
+# ---------------------------#
+
+CHANGE_CHANNEL = "libtech_changes"   # notified by log_change_event() in Audit_Log.sql
+CHANGE_POLL_SECONDS = 5              # fallback poll interval in case a notification is missed
+CHANGE_BATCH_SIZE = 1000
+
+# Event ids are taken at insert time, so a long transaction can commit id N after N + 1 is visible, and a
+# cursor on "event_id > last" would skip N. Readers follow a horizon instead: every transaction with a txid
+# below the oldest one still running has ended, so the events of txids in [previous horizon, new horizon)
+# are complete and were never read before.
+CHANGE_HORIZON_SQL = "SELECT txid_snapshot_xmin(txid_current_snapshot());"
+
+# One window of events, paged by event_id
+CHANGE_EVENTS_SQL = """
+    SELECT event_id, table_name, operation, row_key, changes, changed_by, occurred_at, txid
+    FROM change_events
+    WHERE txid >= %s AND txid < %s AND event_id > %s
+    ORDER BY event_id
+    LIMIT %s;
+"""
+
+# Latest transaction below the horizon per table, one index lookup each on idx_change_events_table_txid
+CHANGE_VERSIONS_SQL = """
+    SELECT t.table_name, (SELECT MAX(e.txid) FROM change_events e WHERE e.table_name = t.table_name AND e.txid < %s)
+    FROM unnest(%s::TEXT[]) AS t(table_name);
+"""
+
+def read_change_events(horizon, end, after_id=0, limit=CHANGE_BATCH_SIZE):
+    """
+    Polling cursor over the audit log: returns up to `limit` events of the transactions in [horizon, end)
+    after `after_id`, oldest first. `end` comes from CHANGE_HORIZON_SQL and becomes the next horizon.
+    """
+    return run_query(CHANGE_EVENTS_SQL, (horizon, end, after_id, limit))
+
+class ChangeFeed:
+    """
+    Shared per-process follower of change_events. A background thread LISTENs on CHANGE_CHANNEL,
+    reads the events of transactions that ended since its horizon (see CHANGE_HORIZON_SQL) in id order
+    in batches and passes each batch to the subscribers, so caches can apply changes instead of rescanning
+    tables. It only uses its own connection, never Streamlit calls.
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        self.horizon = None      # the events of every txid below it have been delivered
+        self.window = None       # (end, last event_id delivered) while a window is partly delivered
+        self.versions = {}       # table name -> txid of the latest event seen for it
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="libtech-change-feed", daemon=True)
+
+    def start(self):
+        # Fix the starting position before returning, so a subscriber that loads its data afterwards misses nothing
+        start_conn = None
+        try:
+            start_conn = psycopg2.connect(**self.settings)
+            with start_conn.cursor() as cur:
+                self.read_position(cur)
+            start_conn.rollback()
+        except Exception:
+            logger.warning("Change feed: could not read the starting position; the feed thread will retry", exc_info=True)
+        finally:
+            if start_conn is not None:
+                start_conn.close()
+        self.thread.start()
+        return self
+
+    def read_position(self, cur):
+        cur.execute(CHANGE_HORIZON_SQL)
+        horizon = cur.fetchone()[0]
+        # Start from each table's latest transaction, so every app process reports the same versions
+        cur.execute(CHANGE_VERSIONS_SQL, (horizon, sorted(AUDITED_TABLES)))
+        self.versions.update((table, txid) for table, txid in cur.fetchall() if txid is not None)
+        self.horizon = horizon
+
+    def subscribe(self, callback):
+        """
+        Registers callback(events), called from the feed thread with each batch as a list of dicts.
+        Subscribe before loading the data the callback maintains: events are only delivered from then on.
+        """
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def following(self):
+        """
+        Returns True once the feed has a position in change_events (never, without Audit_Log.sql).
+        """
+        return self.horizon is not None
+
+    def version(self, table):
+        """
+        Returns a counter that increases whenever the table changes (0 until a change is seen).
+        """
+        return self.versions.get(table, 0)
+
+    def run(self):
+        while True:
+            listen_conn = None
+            try:
+                listen_conn = psycopg2.connect(**self.settings)
+                listen_conn.autocommit = True
+                with listen_conn.cursor() as cur:
+                    cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(CHANGE_CHANNEL)))
+                    if self.horizon is None:
+                        self.read_position(cur)
+                while True:
+                    self.drain(listen_conn)
+                    if select.select([listen_conn], [], [], CHANGE_POLL_SECONDS) != ([], [], []):
+                        listen_conn.poll()
+                        listen_conn.notifies.clear()
+            except Exception:
+                time.sleep(CHANGE_POLL_SECONDS)
+            finally:
+                if listen_conn is not None:
+                    listen_conn.close()
+
+    def drain(self, listen_conn):
+        """
+        Reads and dispatches the events of every transaction that ended since the horizon, one batch at
+        a time, then moves the horizon. A window interrupted by an error resumes after its last batch.
+        """
+        if self.window is None:
+            with listen_conn.cursor() as cur:
+                cur.execute(CHANGE_HORIZON_SQL)
+                end = cur.fetchone()[0]
+            if end <= self.horizon:
+                return
+            self.window = (end, 0)
+        while True:
+            end, after_id = self.window
+            with listen_conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(CHANGE_EVENTS_SQL, (self.horizon, end, after_id, CHANGE_BATCH_SIZE))
+                events = cur.fetchall()
+            if not events:
+                self.horizon, self.window = end, None
+                return
+            for event in events:
+                # Every txid of this window is above those of earlier windows, so versions only grow
+                self.versions[event["table_name"]] = max(self.versions.get(event["table_name"], 0), event["txid"])
+            self.window = (end, events[-1]["event_id"])
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for callback in subscribers:
+                try:
+                    callback(events)
+                except Exception:
+                    logger.exception("Change feed subscriber %r failed; its data may be stale", callback)
+            if len(events) < CHANGE_BATCH_SIZE:
+                self.horizon, self.window = end, None
+                return
+
+@st.cache_resource
+def get_change_feed():
+    """
+    Starts the process-wide change feed on the primary database.
+    """
+    if DB_SETTINGS is None:
+        return None
+    return ChangeFeed(DB_SETTINGS).start()
+
+# ---------------------------#
+#      Lookup Indexes         #
+# ---------------------------#
+
+# Key columns offered as typeahead suggestions in the parameter and Add Data forms
+LOOKUP_SOURCES = {
+    "branchid": "SELECT branchid FROM libraryy",
+    "username": "SELECT username FROM customer",
+    "isbn": "SELECT isbn FROM books_for_sale",
+    "bookid": "SELECT bookid FROM books_for_rent",
+}
+
+# Above this size a lookup falls back to a free-text input validated against the index
+MAX_LOOKUP_OPTIONS = 5000
+
+class PrefixIndex:
+    """
+    Sorted in-memory array of key values answering prefix lookups with binary search.
+    """
+    def __init__(self, values=()):
+        self._keys = sorted(set(values))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, value):
+        i = bisect.bisect_left(self._keys, value)
+        return i < len(self._keys) and self._keys[i] == value
+
+    def add(self, value):
+        """
+        Inserts a single value, keeping the array sorted.
+        """
+        with self._lock:
+            if value and value not in self:
+                bisect.insort(self._keys, value)
+
+    def remove(self, value):
+        with self._lock:
+            i = bisect.bisect_left(self._keys, value)
+            if i < len(self._keys) and self._keys[i] == value:
+                del self._keys[i]
+
+    def lookup(self, prefix, limit=10):
+        """
+        Returns up to `limit` values starting with `prefix`, in sorted order.
+        """
+        start = bisect.bisect_left(self._keys, prefix)
+        end = bisect.bisect_left(self._keys, prefix + "\uffff", lo=start)
+        return self._keys[start:min(end, start + limit)]
+
+    def values(self):
+        return list(self._keys)
+
+# Audited table -> lookup index fed by its inserts and deletes
+LOOKUP_TABLES = {
+    "libraryy": "branchid",
+    "customer": "username",
+    "books_for_sale": "isbn",
+    "books_for_rent": "bookid",
+}
+
+def apply_lookup_changes(indexes, events):
+    """
+    Change feed subscriber: keeps the lookup indexes in step with writes made outside this process.
+    """
+    for event in events:
+        name = LOOKUP_TABLES.get(event["table_name"])
+        if name is None:
+            continue
+        value = event["row_key"][name].strip()
+        if event["operation"] == "I":
+            indexes[name].add(value)
+        elif event["operation"] == "D":
+            indexes[name].remove(value)
+
+@st.cache_resource
+def get_lookup_indexes():
+    """
+    Loads every lookup index once per process; the change feed keeps them current afterwards.
+    The feed is subscribed before the load and events arriving during it are applied afterwards
+    (adds and removes are idempotent), so no write between the two is lost.
+    Raises if a load fails, so the failure is not cached and the next rerun tries again.
+    """
+    if conn is None:
+        raise psycopg2.OperationalError("No database connection.")
+    indexes = {}
+    pending = []   # events delivered while loading
+    loaded = threading.Event()
+    lock = threading.Lock()
+
+    def follow(events):
+        with lock:
+            if not loaded.is_set():
+                pending.extend(events)
+                return
+        apply_lookup_changes(indexes, events)
+
+    feed = get_change_feed()
+    if feed is not None:
+        feed.subscribe(follow)
+    try:
+        for name, query in LOOKUP_SOURCES.items():
+            df = fetch_dataframe(conn, query)
+            indexes[name] = PrefixIndex(df.iloc[:, 0].str.strip() if not df.empty else ())
+    except psycopg2.Error:
+        conn.rollback()
+        if feed is not None:
+            feed.unsubscribe(follow)
+        raise
+    with lock:
+        apply_lookup_changes(indexes, pending)
+        pending.clear()
+        loaded.set()
+    return indexes
+
+def register_lookup_value(name, value):
+    """
+    Adds a newly written key to its lookup index so suggestions stay current without a reload.
+    """
+    try:
+        get_lookup_indexes()[name].add(value)
+    except psycopg2.Error:
+        pass   # not loaded yet: the next load reads the value from the table
+
+def lookup_input(label, name, key=None):
+    """
+    Renders a typeahead input backed by the named lookup index and returns the chosen value.
+    Small indexes use a searchable selectbox; large ones use a text input that is checked on submit.
+    Falls back to a plain text input when the indexes cannot be loaded.
+    """
+    try:
+        index = get_lookup_indexes()[name]
+    except psycopg2.Error as e:
+        st.warning(f"Suggestions for {label} are unavailable: {e}")
+        return st.text_input(label, key=key)
+    if len(index) <= MAX_LOOKUP_OPTIONS:
+        choice = st.selectbox(label, index.values(), index=None, placeholder="Type to search...", key=key)
+        return choice or ""
+    return st.text_input(label, key=key)
+
+def unknown_lookup_values(*pairs):
+    """
+    Checks submitted (index name, value) pairs against their lookup indexes.
+    Shows a warning with suggestions for each unknown value and returns True if any were found.
+    Without the indexes nothing is rejected here; the foreign keys still check the values on insert.
+    """
+    try:
+        indexes = get_lookup_indexes()
+    except psycopg2.Error:
+        return False
+    unknown = False
+    for name, value in pairs:
+        if value and value not in indexes[name] and value not in staged_lookup_values(name):
+            unknown = True
+            suggestions = indexes[name].lookup(value[:max(len(value) - 1, 1)])
+            hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+            st.warning(f"Unknown {name} '{value}'.{hint}")
+    return unknown
+
+# ---------------------------#
+#       Reference Data        #
+# ---------------------------#
+
+# Small, rarely changing tables held in memory once per process, keyed by their primary key columns
+REFERENCE_TABLES = {
+    "libraryy": ["branchid"],
+    "supplier": ["supp_name", "address"],
+    "publisher": ["publisher_name"],
+    "items": ["barcode"],
+    "books_for_sale": ["isbn"],
+}
+REFERENCE_MAX_AGE_SECONDS = 600   # reload even without a change event, for databases without Audit_Log.sql
+REFERENCE_RECHECK_SECONDS = 5     # a key missing from a copy older than this is looked up again before it is rejected
+
+class ReferenceData:
+    """
+    Process-wide cache of the REFERENCE_TABLES as compact DataFrames: text columns are categorical,
+    NUMERIC columns float64, and rows are indexed by primary key. Each table is loaded on first use and
+    reloaded when its version moves, i.e. when the change feed sees a write to it or this process writes it.
+    Failed and empty loads are not kept, so they are retried on the next use.
+    """
+    def __init__(self, feed):
+        self.feed = feed
+        self.frames = {}           # table -> (version, loaded_at, frame)
+        self.local_versions = {}   # table -> writes made through this process
+        self.lock = threading.Lock()
+
+    def version(self, table):
+        feed_version = self.feed.version(table) if self.feed is not None else 0
+        return (feed_version, self.local_versions.get(table, 0))
+
+    def invalidate(self, table):
+        with self.lock:
+            self.local_versions[table] = self.local_versions.get(table, 0) + 1
+
+    def frame(self, table, reload=False):
+        """
+        Returns the table's cached DataFrame, loading it if it is missing or stale or reload is set.
+        Returns None if the load failed (the error is shown).
+        """
+        with self.lock:
+            version = self.version(table)
+            cached = self.frames.get(table)
+            if not reload and cached and cached[0] == version and time.monotonic() - cached[1] < REFERENCE_MAX_AGE_SECONDS:
+                return cached[2]
+        frame = self.load(table, fresh=reload)
+        if frame is not None and not frame.empty:
+            with self.lock:
+                self.frames[table] = (version, time.monotonic(), frame)
+        return frame
+
+    def loaded_at(self, table):
+        with self.lock:
+            cached = self.frames.get(table)
+        return cached[1] if cached else None
+
+    @staticmethod
+    def load(table, fresh=False):
+        keys = REFERENCE_TABLES[table]
+        result = run_analytics_table(sql.SQL("SELECT * FROM {}").format(sql.Identifier(table)), fresh=fresh, stale_ok=False)
+        if result is None:
+            return None
+        df = result.to_pandas()
+        if df.empty:
+            return df
+        for col in df.columns:
+            first = df[col].dropna().head(1)
+            if first.empty:
+                continue
+            if type(first.iloc[0]).__name__ == "Decimal":
+                df[col] = df[col].astype(np.float64)
+            elif isinstance(first.iloc[0], str) and col not in keys:
+                df[col] = df[col].astype("category")
+        df.index = pd.MultiIndex.from_frame(df[keys]) if len(keys) > 1 else pd.Index(df[keys[0]])
+        return df
+
+    def contains(self, table, key):
+        """
+        Returns whether the key is in the table, or None if the table could not be loaded. A key missing
+        from a copy older than REFERENCE_RECHECK_SECONDS (e.g. inserted by another process, which
+        only the change feed would announce) is looked up in a fresh load before False is returned.
+        """
+        frame = self.frame(table)
+        if frame is None:
+            return None
+        if not frame.empty and key in frame.index:
+            return True
+        loaded_at = self.loaded_at(table)
+        if loaded_at is None or time.monotonic() - loaded_at < REFERENCE_RECHECK_SECONDS:
+            return False   # just loaded (empty tables are never kept)
+        frame = self.frame(table, reload=True)
+        if frame is None:
+            return None
+        return not frame.empty and key in frame.index
+
+    def labels(self, table, keys, column):
+        """
+        Maps a Series of keys to one column of the table (e.g. ISBN -> title); unknown keys keep their key.
+        """
+        frame = self.frame(table)
+        if frame is None or frame.empty:
+            return keys.astype(str)
+        return keys.map(frame[column].astype(object)).fillna(keys).astype(str)
+
+@st.cache_resource
+def get_reference_data():
+    return ReferenceData(get_change_feed())
+
+def invalidate_reference_table(table):
+    """
+    Marks a reference table stale after this process wrote to it (table names are matched case-insensitively).
+    """
+    if table.lower() in REFERENCE_TABLES:
+        get_reference_data().invalidate(table.lower())
+
+def unknown_reference_values(table, *keys, label=None):
+    """
+    Warns and returns True if a key is not in the reference table. For tables with multi-column keys,
+    passing fewer values checks a key prefix (e.g. a supplier by name only). Keys staged for the same table in this session cannot be checked yet and are let through.
+    """
+    if any(w["table"].lower() == table for w in staged_writes()):
+        return False
+    key = keys if len(keys) > 1 else keys[0]
+    if get_reference_data().contains(table, key) is not False:
+        return False   # known, or the table could not be read (the foreign keys still check it)
+    st.warning(f"Unknown {label or table} '{' / '.join(map(str, keys))}'.")
+    return True
+
+# ---------------------------#
+#    Add Data Unit of Work    #
+# ---------------------------#
+
+# With staging on, Add Data forms queue their statements in st.session_state["staged_writes"] instead of
+# committing each one; the queue is previewed and then committed together by execute_transaction().
+
+def staged_writes():
+    return st.session_state.setdefault("staged_writes", [])
+
+def staged_lookup_values(name):
+    """
+    Returns the keys of the named lookup index that staged, not yet committed, inserts will create.
+    """
+    return {w["lookup"][1] for w in staged_writes() if w["lookup"] and w["lookup"][0] == name}
+
+def save_row(table, query, params, summary=None, lookup=None):
+    """
+    Writes one Add Data row now, or stages it when staging is on.
+    summary is what the preview shows (defaults to the parameters; pass one when they hold secrets);
+    lookup is the (index name, key) pair the row creates. Returns True if the row was committed or staged.
+    """
+    if st.session_state.get("stage_writes"):
+        if summary is None:
+            summary = ", ".join(str(p) for p in params)
+        staged_writes().append({"table": table, "query": query, "params": params, "summary": summary, "lookup": lookup})
+        st.info(f"Staged for {table}. {len(staged_writes())} change(s) waiting to be committed.")
+        return True
+    if execute_query(query, params):
+        if lookup:
+            register_lookup_value(*lookup)
+        invalidate_reference_table(table)
+        return True
+    return False
+
+def commit_staged_writes():
+    """
+    Commits every staged write in one transaction and clears the queue on success.
+    """
+    writes = staged_writes()
+    if not execute_transaction([(w["query"], w["params"]) for w in writes]):
+        return False
+    for w in writes:
+        if w["lookup"]:
+            register_lookup_value(*w["lookup"])
+        invalidate_reference_table(w["table"])
+    writes.clear()
+    return True
+
+# ---------------------------#
+#       Authentication        #
+# ---------------------------#
+
+PASSCODE_HASH_COST = 10          # bcrypt work factor (log2 rounds) passed to gen_salt('bf', ...)
+SESSION_TTL_SECONDS = 15 * 60    # how long a login is trusted before credentials are asked again
+SESSION_CACHE_SIZE = 1000        # maximum number of live sessions kept per process
+REQUIRE_STAFF_LOGIN_FOR_ADD_DATA = False   # set to True to limit the Add Data page to logged-in staff
+
+class SessionCache:
+    """
+    Bounded, thread-safe LRU map from session tokens to authenticated identities with a fixed TTL.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, identity):
+        """
+        Stores an identity and returns the new session token for it.
+        """
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, identity)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """
+        Returns the identity for a token, or None if it is unknown or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires, identity = entry
+            if expires < time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return identity
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+@st.cache_resource
+def get_session_cache():
+    return SessionCache(SESSION_CACHE_SIZE, SESSION_TTL_SECONDS)
+
+def verify_credentials(email, passcode):
+    """
+    Verifies an email/passcode pair against authentication_system and returns the identity
+    ({"email", "role", "username"}, username being set for customers only) or None. Accounts still holding only the legacy pgp_sym_encrypt passcode
+    are checked by decryption once and upgraded to a bcrypt hash on the spot.
+    """
+    verify_sql = """
+        SELECT
+            a.passcode_hash IS NULL AS legacy,
+            COALESCE(a.passcode_hash = crypt(%s, a.passcode_hash),
+                     pgp_sym_decrypt(a.passcode, %s) = %s) AS valid,
+            CASE
+                WHEN s.ssn IS NOT NULL THEN 'Staff'
+                WHEN c.username IS NOT NULL THEN 'Customer'
+            END AS role,
+            c.username
+        FROM authentication_system a
+        LEFT JOIN staff s ON s.st_email = a.email
+        LEFT JOIN customer c ON c.ct_email = a.email
+        WHERE a.email = %s;
+    """
+    df = run_query(verify_sql, (passcode, ENCRYPTION_KEY, passcode, email))
+    if df.empty or not df.iloc[0]["valid"] or df.iloc[0]["role"] is None:
+        return None
+    if df.iloc[0]["legacy"]:
+        upgrade_sql = """
+            UPDATE authentication_system
+            SET passcode_hash = crypt(%s, gen_salt('bf', %s))
+            WHERE email = %s AND passcode_hash IS NULL;
+        """
+        execute_query(upgrade_sql, (passcode, PASSCODE_HASH_COST, email), suppress_success=True)
+    username = df.iloc[0]["username"] if df.iloc[0]["role"] == "Customer" else None
+    return {"email": email, "role": df.iloc[0]["role"], "username": username}
+
+def current_identity():
+    """
+    Returns the identity logged in for this browser session, without touching the database.
+    """
+    token = st.session_state.get("auth_token")
+    return get_session_cache().get(token) if token else None
+
+# ---------------------------#
+#     Tenant Connections      #
+# ---------------------------#
+
+# Customer and staff pages run on pooled connections scoped to the logged-in user, so the row-level
+# security policies of Security Mechanism 6 (BONUSES.sql) decide which rows each query can see.
+TENANT_POOL_SIZE = 10
+TENANT_ROLES = {"Customer": "customerr", "Staff": "librariann"}   # database roles from BONUSES.sql
+
+@st.cache_resource
+def get_tenant_pool():
+    """
+    Opens the process-wide pool of connections lent to user-scoped queries, under the circulation timeout.
+    """
+    if DB_SETTINGS is None:
+        return None
+    try:
+        return ThreadedConnectionPool(
+            1, TENANT_POOL_SIZE, **DB_SETTINGS, options=f"-c statement_timeout={STATEMENT_TIMEOUTS['circulation']}"
+        )
+    except Exception as e:
+        st.error(f"Error opening the connection pool: {e}")
+        return None
+
+@contextmanager
+def tenant_cursor(identity):
+    """
+    Checks out a pooled connection for one transaction as the identity: SET LOCAL ROLE to its database
+    role and app.current_user to its username (customers) or email (staff). Both settings are local to
+    the transaction, so committing or rolling back at checkin resets the connection for the next user.
+    """
+    pool = get_tenant_pool()
+    if pool is None:
+        raise psycopg2.OperationalError("No database connection.")
+    tenant_conn = pool.getconn()
+    try:
+        with tenant_conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql.SQL("SET LOCAL ROLE {};").format(sql.Identifier(TENANT_ROLES[identity["role"]])))
+            cur.execute("SELECT set_config('app.current_user', %s, true);", (identity.get("username") or identity["email"],))
+            yield cur
+        tenant_conn.commit()
+    except Exception:
+        if not tenant_conn.closed:
+            tenant_conn.rollback()
+        raise
+    finally:
+        pool.putconn(tenant_conn, close=bool(tenant_conn.closed))
+
+def run_tenant_query(identity, query, params=None):
+    """
+    Executes a SQL query as the logged-in user and returns the rows the RLS policies allow as a DataFrame.
+    """
+    try:
+        with tenant_cursor(identity) as cur:
+            cur.execute(query, params)
+            records = cur.fetchall()
+        return pd.DataFrame(records) if records else pd.DataFrame()
+    except Exception as e:
+        st.error(f"Error executing query: {e}")
+        return pd.DataFrame()
+
+# ---------------------------#
+#    Time-Series Analytics    #
+# ---------------------------#
+
+# Metrics served from the daily fact tables in Daily_Aggregates.sql
+TIME_SERIES_METRICS = {
+    "Borrows": {"table": "daily_borrows", "value": "borrow_count", "key": "isbn"},
+    "Book Sales Revenue": {"table": "daily_book_sales", "value": "revenue", "key": "isbn"},
+    "Book Copies Sold": {"table": "daily_book_sales", "value": "quantity", "key": "isbn"},
+    "Item Sales Revenue": {"table": "daily_item_sales", "value": "revenue", "key": "barcode"},
+    "Item Units Sold": {"table": "daily_item_sales", "value": "quantity", "key": "barcode"},
+}
+TIME_SERIES_GRANULARITIES = ["day", "week", "month"]
+
+def run_time_series(metric, start_date, end_date, granularity, group_by=None):
+    """
+    Sums a metric's daily buckets over [start_date, end_date] into day/week/month periods,
+    optionally split by "branchid" or by the metric's ISBN/barcode column.
+    """
+    details = TIME_SERIES_METRICS[metric]
+    group_cols = [sql.Identifier(group_by)] if group_by else []
+    query = sql.SQL("""
+        SELECT date_trunc({granularity}, day)::DATE AS period, {group_cols}SUM({value}) AS {value}
+        FROM {table}
+        WHERE day BETWEEN %s AND %s
+        GROUP BY period{group_by}
+        ORDER BY period;
+    """).format(
+        granularity=sql.Literal(granularity),
+        group_cols=sql.SQL("").join(col + sql.SQL(", ") for col in group_cols),
+        value=sql.Identifier(details["value"]),
+        table=sql.Identifier(details["table"]),
+        group_by=sql.SQL("").join(sql.SQL(", ") + col for col in group_cols),
+    )
+    return run_query(query, (start_date, end_date), replica_ok=True)
+
+# ---------------------------#
+#    Customer Segmentation    #
+# ---------------------------#
+
+# Per-customer purchase activity of all customers, or of the customers in %(usernames)s. Books and items are
+# aggregated separately before being combined, so one table's rows never multiply the other's spending.
+CUSTOMER_ACTIVITY_SQL = """
+    SELECT
+        c.username,
+        MAX(t.last_purchase) AS last_purchase,
+        COALESCE(SUM(t.orders), 0) AS orders,
+        COALESCE(SUM(t.spending), 0) AS spending
+    FROM customer c
+    LEFT JOIN (
+        SELECT bb.username, MAX(bb.date_time) AS last_purchase, COUNT(*) AS orders, SUM(bb.quantity * bfs.price) AS spending
+        FROM buys_books bb
+        JOIN books_for_sale bfs ON bb.isbn = bfs.isbn
+        WHERE %(usernames)s IS NULL OR bb.username = ANY(%(usernames)s)
+        GROUP BY bb.username
+        UNION ALL
+        SELECT pi.username, MAX(pi.date_time), COUNT(*), SUM(pi.quantity * i.price)
+        FROM purchases_items pi
+        JOIN items i ON pi.barcode = i.barcode
+        WHERE %(usernames)s IS NULL OR pi.username = ANY(%(usernames)s)
+        GROUP BY pi.username
+    ) t ON t.username = c.username
+    WHERE %(usernames)s IS NULL OR c.username = ANY(%(usernames)s)
+    GROUP BY c.username;
+"""
+
+SEGMENT_FULL_REFRESH_SECONDS = 3600   # rebuild from scratch hourly, e.g. to pick up price changes
+SEGMENT_REFRESH_SECONDS = 60          # otherwise recompute the customers with new purchases this often
+PURCHASE_TABLES = ("buys_books", "purchases_items")
+
+class CustomerActivityCache:
+    """
+    Process-wide per-customer (last_purchase, orders, spending) table. Customers the change feed reports
+    purchases for are recomputed from their whole history, so date-only and back-dated purchases count
+    as soon as they are written. Without the feed the whole table is reloaded every SEGMENT_REFRESH_SECONDS.
+    """
+    def __init__(self, feed):
+        self.feed = feed
+        self.activity = None
+        self.changed = set()   # usernames with purchases written since their last recompute
+        self.full_refreshed_at = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        self.changed_lock = threading.Lock()
+        if feed is not None:
+            feed.subscribe(self.mark_changed)
+
+    def mark_changed(self, events):
+        """
+        Change feed subscriber: remembers whose purchases changed.
+        """
+        usernames = {e["row_key"]["username"] for e in events if e["table_name"] in PURCHASE_TABLES}
+        if usernames:
+            with self.changed_lock:
+                self.changed |= usernames
+
+    def take_changed(self):
+        with self.changed_lock:
+            changed, self.changed = self.changed, set()
+        return changed
+
+    def put_back(self, usernames):
+        with self.changed_lock:
+            self.changed |= usernames
+
+    def refresh(self):
+        now = time.monotonic()
+        with self.lock:
+            full = self.activity is None or self.feed is None or now - self.full_refreshed_at > SEGMENT_FULL_REFRESH_SECONDS
+            if self.activity is not None and now - self.refreshed_at <= SEGMENT_REFRESH_SECONDS:
+                return self.activity
+            changed = self.take_changed()
+            if full:
+                activity = self.fetch()
+                if activity.empty:
+                    self.put_back(changed)
+                    return self.activity
+                self.activity = activity
+                self.full_refreshed_at = now
+            elif changed:
+                updated = self.fetch(sorted(changed))
+                if updated.empty:
+                    self.put_back(changed)
+                    return self.activity
+                unchanged = self.activity[~self.activity["username"].isin(updated["username"])]
+                self.activity = pd.concat([unchanged, updated], ignore_index=True)
+            self.refreshed_at = now
+            return self.activity
+
+    @staticmethod
+    def fetch(usernames=None):
+        """
+        Reads the activity of the given customers (from the primary, right after their writes) or of everyone.
+        """
+        df = run_analytics_query(CUSTOMER_ACTIVITY_SQL, {"usernames": usernames}, fresh=usernames is not None)
+        if df.empty:
+            return df
+        df["last_purchase"] = pd.to_datetime(df["last_purchase"])
+        df["orders"] = df["orders"].astype(np.int64)
+        df["spending"] = df["spending"].astype(np.float64)
+        return df
+
+@st.cache_resource
+def get_customer_activity_cache():
+    return CustomerActivityCache(get_change_feed())
+
+def get_customer_segments():
+    """
+    Returns the RFM segments of all customers from the shared activity cache.
+    """
+    activity = get_customer_activity_cache().refresh()
+    if activity is None or activity.empty:
+        return pd.DataFrame()
+    return offload(score_customers, activity)
+
+# ---------------------------#
+#       Recommendations       #
+# ---------------------------#
+
+# Every customer x ISBN pair seen in borrows (through the rented copy's ISBN) or book purchases
+INTERACTIONS_SQL = """
+    SELECT b.username, br.isbn
+    FROM borrows b
+    JOIN books_for_rent br ON b.bookid = br.bookid
+    UNION
+    SELECT username, isbn
+    FROM buys_books;
+"""
+
+BOOK_TITLES_SQL = """
+    SELECT isbn, MIN(title) AS title
+    FROM (
+        SELECT isbn, title FROM books_for_sale
+        UNION ALL
+        SELECT isbn, title FROM books_for_rent
+    ) t
+    GROUP BY isbn;
+"""
+
+def rebuild_book_neighbours():
+    """
+    Batch job: recomputes the book_neighbours table from the full interaction history in one transaction.
+    The history is read on its own connection under the batch timeout, not through the report path, whose
+    circuit breaker could hand back a stale result; if the read fails, nothing is rebuilt.
+    """
+    if DB_SETTINGS is None:
+        st.error("No database connection.")
+        return False
+    batch_conn = None
+    try:
+        batch_conn = psycopg2.connect(**DB_SETTINGS, options=f"-c statement_timeout={STATEMENT_TIMEOUTS['batch']}")
+        batch_conn.set_session(readonly=True)
+        with batch_conn.cursor() as cur:
+            interactions = fetch_frame(cur, INTERACTIONS_SQL)
+    except Exception as e:
+        st.error(f"Error reading borrows and purchases for recommendations: {e}")
+        return False
+    finally:
+        if batch_conn is not None:
+            batch_conn.close()
+    if interactions.empty:
+        st.warning("No borrows or purchases to build recommendations from.")
+        return False
+    neighbours = offload(build_book_neighbours, interactions)
+    rows = list(zip(
+        neighbours["isbn"].tolist(),
+        neighbours["neighbour_isbn"].tolist(),
+        neighbours["score"].round(6).tolist(),
+        neighbours["rank"].tolist(),
+    ))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('statement_timeout', %s, true);", (STATEMENT_TIMEOUTS["batch"],))
+            cur.execute("TRUNCATE book_neighbours;")
+            execute_values(cur, "INSERT INTO book_neighbours (isbn, neighbour_isbn, score, rank) VALUES %s", rows, page_size=5000)
+        conn.commit()
+    except Exception as e:
+        st.error(f"Error rebuilding recommendations: {e}")
+        conn.rollback()
+        return False
+    load_book_recommender.clear()
+    st.success(f"Recommendations rebuilt: {len(rows)} neighbour pairs for {neighbours['isbn'].nunique()} books.")
+    return True
+
+class BookRecommender:
+    """
+    In-memory top-K neighbour lists and customer histories answering recommendation lookups
+    without database round trips.
+    """
+    def __init__(self, neighbours, interactions, titles):
+        self.titles = titles
+        self.neighbours = {
+            isbn: list(zip(group["neighbour_isbn"], group["score"]))
+            for isbn, group in neighbours.sort_values(["isbn", "rank"]).groupby("isbn", sort=False)
+        }
+        self.history = interactions.groupby("username")["isbn"].agg(frozenset).to_dict() if not interactions.empty else {}
+
+    def isbns(self):
+        return sorted(self.neighbours)
+
+    def similar_books(self, isbn, limit=10):
+        """
+        Returns [(isbn, title, score)] for the books most often borrowed or bought with `isbn`.
+        """
+        return [(n, self.titles.get(n, ""), score) for n, score in self.neighbours.get(isbn, [])[:limit]]
+
+    def for_customer(self, username, limit=10):
+        """
+        Returns [(isbn, title, score)] for books a customer has not borrowed or bought yet,
+        scored by summing the similarities to everything in their history.
+        """
+        seen = self.history.get(username, frozenset())
+        totals = {}
+        for isbn in seen:
+            for n, score in self.neighbours.get(isbn, ()):
+                if n not in seen:
+                    totals[n] = totals.get(n, 0.0) + score
+        top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+        return [(n, self.titles.get(n, ""), score) for n, score in top]
+
+RECOMMENDER_MAX_AGE_SECONDS = 600   # a rebuild in another app process is picked up within this long
+
+@st.cache_resource(ttl=RECOMMENDER_MAX_AGE_SECONDS)
+def load_book_recommender():
+    """
+    Loads the precomputed neighbour table, customer histories and titles, or returns None if a query failed.
+    """
+    results = [
+        run_analytics_table(query, stale_ok=False)
+        for query in ("SELECT isbn, neighbour_isbn, score, rank FROM book_neighbours;", INTERACTIONS_SQL, BOOK_TITLES_SQL)
+    ]
+    if any(result is None for result in results):
+        return None
+    neighbours, interactions, titles_df = (result.to_pandas() for result in results)
+    if neighbours.empty:
+        neighbours = pd.DataFrame(columns=["isbn", "neighbour_isbn", "score", "rank"])
+    titles = dict(zip(titles_df["isbn"], titles_df["title"])) if not titles_df.empty else {}
+    return BookRecommender(neighbours, interactions, titles)
+
+def get_book_recommender():
+    """
+    Returns the process's recommender, or None if it could not be loaded. Failed and empty loads are
+    dropped from the cache, so the next run tries again instead of keeping them for the whole TTL.
+    """
+    recommender = load_book_recommender()
+    if recommender is None or not recommender.neighbours:
+        load_book_recommender.clear()
+    return recommender
+
+# ---------------------------#
+#   Rental Demand Forecast    #
+# ---------------------------#
+
+RENTAL_LOANS_SQL = """
+    SELECT br.isbn, b.date_out, b.due_date, b.status
+    FROM borrows b
+    JOIN books_for_rent br ON b.bookid = br.bookid
+    WHERE b.date_out >= CURRENT_DATE - make_interval(months => %s);
+"""
+
+RENTAL_STOCK_SQL = """
+    SELECT r.isbn, r.title, r.copies, COALESCE(s.sale_copies, 0) AS sale_copies
+    FROM (
+        SELECT isbn, MIN(title) AS title, COUNT(*) AS copies
+        FROM books_for_rent
+        GROUP BY isbn
+    ) r
+    LEFT JOIN (
+        SELECT isbn, SUM(number_of_copies) AS sale_copies
+        FROM stores_booksforsale
+        GROUP BY isbn
+    ) s ON s.isbn = r.isbn;
+"""
+
+@st.cache_data(ttl=3600)
+def get_rental_demand_forecast():
+    """
+    Returns the demand forecast for all rented ISBNs, recomputed at most hourly.
+    """
+    loans = run_query(RENTAL_LOANS_SQL, (FORECAST_MONTHS,), replica_ok=True)
+    stock = run_query(RENTAL_STOCK_SQL, replica_ok=True)
+    if stock.empty:
+        return pd.DataFrame()
+    if loans.empty:
+        loans = pd.DataFrame(columns=["isbn", "date_out", "due_date", "status"])
+    return offload(forecast_rental_demand, loans, stock)
+
+# ---------------------------#
+#     Analytics Snapshot      #
+# ---------------------------#
+
+# Columnar copy of the schema that heavy reports can run against instead of the live database.
+# Tables with a date column are stored as one Parquet file per month, so a refresh only rewrites
+# the months that Change_Events shows were touched; other tables are rewritten whole when changed.
+SNAPSHOT_DIR = os.environ.get("LIBTECH_SNAPSHOT_DIR", "snapshot")
+SNAPSHOT_TABLES = {
+    "customer": None,
+    "libraryy": None,
+    "staff": None,
+    "dependents": None,
+    "supplier": None,
+    "publisher": None,
+    "items": None,
+    "books_for_sale": None,
+    "books_for_rent": None,
+    "authors_booksale": None,
+    "authors_bookrent": None,
+    "stores_items": None,
+    "stores_booksforsale": None,
+    "sale_to_rent": None,
+    "buys_books": "date_time",
+    "purchases_items": "date_time",
+    "borrows": "date_out",
+}
+
+# Views used by the catalogued queries, recreated over the snapshot tables
+SNAPSHOT_VIEWS = {
+    "supplier_supply_summary": """
+        SELECT s.supp_name, i.items_name, SUM(i.qty_supplied) AS total_supplied
+        FROM items i
+        JOIN supplier s ON i.supp_name = s.supp_name
+        GROUP BY s.supp_name, i.items_name
+        ORDER BY s.supp_name
+    """,
+    "customers_with_penalties": """
+        SELECT c.username, c.first_name, c.last_name, SUM(br.penalty) AS total_penalty
+        FROM borrows br
+        JOIN customer c ON br.username = c.username
+        WHERE br.penalty > 0
+        GROUP BY c.username, c.first_name, c.last_name
+        ORDER BY total_penalty DESC
+    """,
+}
+
+def read_snapshot_manifest():
+    """
+    Returns the snapshot's manifest ({"horizon", "refreshed_at", ...}) or {} if there is no snapshot.
+    """
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_snapshot_file(df, table, name):
+    """
+    Atomically writes one Parquet file of a snapshot table; an empty frame removes the file.
+    """
+    table_dir = os.path.join(SNAPSHOT_DIR, table)
+    os.makedirs(table_dir, exist_ok=True)
+    path = os.path.join(table_dir, f"{name}.parquet")
+    if df.empty:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    # NUMERIC arrives as Decimal objects whose inferred precision can differ between files
+    for col in df.columns:
+        first = df[col].dropna().head(1)
+        if not first.empty and type(first.iloc[0]).__name__ == "Decimal":
+            df[col] = df[col].astype(np.float64)
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+def fetch_frame(cur, query, params=None):
+    cur.execute(query, params)
+    return pd.DataFrame(cur.fetchall(), columns=[d.name for d in cur.description])
+
+def export_snapshot_table(cur, table, date_col, months=None):
+    """
+    Exports a table into the snapshot. For date-partitioned tables, `months` limits the export to
+    those "YYYY-MM" months; None exports every month and drops files of months that no longer exist.
+    """
+    table_id = sql.Identifier(table)
+    if date_col is None:
+        write_snapshot_file(fetch_frame(cur, sql.SQL("SELECT * FROM {};").format(table_id)), table, "all")
+        return
+    col_id = sql.Identifier(date_col)
+    if months is None:
+        months_df = fetch_frame(cur, sql.SQL("SELECT DISTINCT to_char({}, 'YYYY-MM') AS month FROM {};").format(col_id, table_id))
+        months = set(months_df["month"]) if not months_df.empty else set()
+        table_dir = os.path.join(SNAPSHOT_DIR, table)
+        if os.path.isdir(table_dir):
+            for name in os.listdir(table_dir):
+                if name.endswith(".parquet") and name[:-len(".parquet")] not in months:
+                    os.remove(os.path.join(table_dir, name))
+    month_sql = sql.SQL("SELECT * FROM {} WHERE {} >= %s::DATE AND {} < %s::DATE + INTERVAL '1 month';").format(table_id, col_id, col_id)
+    for month in sorted(months):
+        df = fetch_frame(cur, month_sql, (f"{month}-01", f"{month}-01"))
+        write_snapshot_file(df, table, month)
+
+def refresh_snapshot():
+    """
+    Snapshot job: brings the Parquet snapshot up to date from one consistent read-only transaction
+    on the primary. Only tables and months changed since the last refresh are rewritten when the
+    audit log is available; otherwise everything is exported.
+    """
+    if DB_SETTINGS is None:
+        st.error("No database connection.")
+        return False
+    manifest = read_snapshot_manifest()
+    export_conn = None
+    try:
+        export_conn = psycopg2.connect(**DB_SETTINGS, options=f"-c statement_timeout={STATEMENT_TIMEOUTS['batch']}")
+        export_conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with export_conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('change_events') IS NOT NULL;")
+            has_log = cur.fetchone()[0]
+            horizon = None
+            if has_log:
+                # Every change of a txid below this horizon is in this transaction's snapshot (see CHANGE_HORIZON_SQL)
+                cur.execute(CHANGE_HORIZON_SQL)
+                horizon = cur.fetchone()[0]
+            # Reports call fine_daily_rate() (Fines.sql); the snapshot gets the same rate as a DuckDB macro
+            cur.execute("SELECT to_regproc('fine_daily_rate') IS NOT NULL;")
+            fine_rate = None
+            if cur.fetchone()[0]:
+                cur.execute("SELECT fine_daily_rate();")
+                fine_rate = cur.fetchone()[0]
+
+            previous_horizon = manifest.get("horizon")
+            incremental = has_log and previous_horizon is not None and set(manifest.get("tables", [])) == set(SNAPSHOT_TABLES)
+            if incremental:
+                cur.execute("""
+                    SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                                   WHERE table_name = 'change_events' AND column_name = 'old_row_key');
+                """)
+                has_old_keys = cur.fetchone()[0]
+                changed_df = fetch_frame(cur, "SELECT DISTINCT table_name FROM change_events WHERE txid >= %s AND txid < %s;", (previous_horizon, horizon))
+                changed = set(changed_df["table_name"]) if not changed_df.empty else set()
+            else:
+                changed = set(SNAPSHOT_TABLES)
+
+            for table, date_col in SNAPSHOT_TABLES.items():
+                if table not in changed:
+                    continue
+                months = None   # every month, also when the log lacks Old_Row_Key and a moved row's old month is unknown
+                if incremental and date_col is not None and has_old_keys:
+                    # An update that changed the date leaves its old month behind: rewrite both months
+                    months_df = fetch_frame(cur, """
+                        SELECT DISTINCT to_char((k ->> %s)::TIMESTAMP, 'YYYY-MM') AS month
+                        FROM change_events, LATERAL (VALUES (row_key), (old_row_key)) AS keys(k)
+                        WHERE table_name = %s AND txid >= %s AND txid < %s AND k IS NOT NULL;
+                    """, (date_col, table, previous_horizon, horizon))
+                    months = set(months_df["month"])
+                export_snapshot_table(cur, table, date_col, months)
+        export_conn.rollback()
+    except Exception as e:
+        st.error(f"Error refreshing snapshot: {e}")
+        return False
+    finally:
+        if export_conn is not None:
+            export_conn.close()
+
+    manifest = {
+        "horizon": horizon,
+        "refreshed_at": datetime.now(timezone.utc).isoformat(),
+        "tables": sorted(SNAPSHOT_TABLES),
+        "changed_tables": sorted(changed),
+        "fine_daily_rate": float(fine_rate) if fine_rate is not None else None,
+    }
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)   # no table files are written when nothing changed
+    with open(os.path.join(SNAPSHOT_DIR, "manifest.json.tmp"), "w") as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(SNAPSHOT_DIR, "manifest.json.tmp"), os.path.join(SNAPSHOT_DIR, "manifest.json"))
+    get_snapshot_db.clear()
+    st.success(f"Snapshot refreshed ({len(changed)} of {len(SNAPSHOT_TABLES)} tables changed).")
+    return True
+
+@st.cache_resource
+def get_snapshot_db():
+    """
+    Opens an in-process DuckDB database with a view over each snapshot table's Parquet files.
+    """
+    db = duckdb.connect()
+    fine_rate = read_snapshot_manifest().get("fine_daily_rate")
+    if fine_rate is not None:
+        db.execute(f"CREATE MACRO fine_daily_rate() AS {float(fine_rate)};")
+    for table in SNAPSHOT_TABLES:
+        pattern = os.path.join(SNAPSHOT_DIR, table, "*.parquet")
+        table_dir = os.path.join(SNAPSHOT_DIR, table)
+        if os.path.isdir(table_dir) and any(name.endswith(".parquet") for name in os.listdir(table_dir)):
+            db.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{pattern}', union_by_name = true);")
+    for view, query in SNAPSHOT_VIEWS.items():
+        try:
+            db.execute(f"CREATE VIEW {view} AS {query};")
+        except duckdb.Error:
+            pass  # a table it depends on is missing from the snapshot
+    return db
+
+def run_snapshot_query(_query):
+    """
+    Executes a catalogued SQL query against the snapshot and returns the result as a pandas DataFrame.
+    """
+    try:
+        return get_snapshot_db().cursor().execute(_query).df()
+    except Exception as e:
+        st.error(f"Error executing query on snapshot: {e}")
+        return pd.DataFrame()
+
+def snapshot_age_text(manifest):
+    refreshed_at = datetime.fromisoformat(manifest["refreshed_at"])
+    minutes = int((datetime.now(timezone.utc) - refreshed_at).total_seconds() // 60)
+    age = f"{minutes} min" if minutes < 120 else f"{minutes // 60} h"
+    return f"{refreshed_at.astimezone().strftime('%Y-%m-%d %H:%M')} ({age} ago)"
+
+# ---------------------------#
+#        Live Reports         #
+# ---------------------------#
+
+LIVE_REFRESH_SECONDS = 5   # how often an open live report checks the change feed (in memory, no query)
+LIVE_TTL_SECONDS = 60      # without the change feed (no Audit_Log.sql), a live report re-runs this often
+
+# Tables whose writes are announced by the change feed (the audit triggers in Audit_Log.sql)
+AUDITED_TABLES = {
+    "authentication_system", "customer", "libraryy", "staff", "dependents", "supplier", "publisher",
+    "items", "books_for_sale", "books_for_rent", "authors_booksale", "authors_bookrent", "stores_items",
+    "stores_booksforsale", "buys_books", "purchases_items", "borrows", "sale_to_rent",
+}
+TRANSACTION_TABLES = ["borrows", "buys_books", "purchases_items"]
+
+def report_tables(query):
+    """
+    Returns the audited tables a report reads. Views and functions hide their tables, so reports that
+    use them are assumed to depend on the transaction tables as well.
+    """
+    names = {n.lower() for n in re.findall(r"\b(?:from|join)\s+([A-Za-z_][A-Za-z0-9_]*)", query, re.IGNORECASE)}
+    tables = sorted(names & AUDITED_TABLES)
+    if names - AUDITED_TABLES:
+        tables = sorted(set(tables) | set(TRANSACTION_TABLES))
+    return tables
+
+def diff_results(old, new):
+    """
+    Compares two results of a report, matching rows by their first column when it is unique in both
+    and by whole rows otherwise. Returns (added, changed, removed) DataFrames.
+    """
+    empty = new.iloc[0:0]
+    if old.empty or new.empty or list(old.columns) != list(new.columns):
+        return new, empty, old
+    first = new.columns[0]
+    key = [first] if new[first].is_unique and old[first].is_unique else list(new.columns)
+    merged = new.merge(old, on=key, how="outer", suffixes=("", "_old"), indicator=True)
+    added = merged.loc[merged["_merge"] == "left_only", new.columns]
+    removed = merged.loc[merged["_merge"] == "right_only", key]
+    both = merged[merged["_merge"] == "both"]
+    changed_mask = pd.Series(False, index=both.index)
+    for col in new.columns:
+        if col not in key:
+            a, b = both[col], both[f"{col}_old"]
+            changed_mask |= ~((a == b) | (a.isna() & b.isna()))
+    return added, both.loc[changed_mask, new.columns], removed
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_report(name, query):
+    """
+    Renders a report that follows the database: every LIVE_REFRESH_SECONDS this fragment alone reruns,
+    compares the versions of the report's tables in the shared change feed with the ones it last showed,
+    and only when they moved re-runs the query and highlights the rows that changed. Without the change
+    feed the query re-runs every LIVE_TTL_SECONDS instead. A failed run keeps the rows last shown and is
+    retried on the next check.
+    """
+    feed = get_change_feed()
+    if feed is not None and feed.following():
+        version = tuple(feed.version(t) for t in report_tables(query))
+        watching = f"watching for changes every {LIVE_REFRESH_SECONDS}s"
+    else:
+        version = ("ttl", int(time.time() // LIVE_TTL_SECONDS))
+        watching = f"re-running every {LIVE_TTL_SECONDS}s"
+    results = st.session_state.setdefault("live_results", {})
+    entry = results.get(name)
+    if entry is None or entry["version"] != version:
+        table = run_analytics_table(query, fresh=True, stale_ok=False)
+        if table is not None:
+            df = table.to_pandas()
+            delta = diff_results(entry["df"], df) if entry is not None else None
+            entry = results[name] = {"version": version, "df": df, "delta": delta, "updated_at": datetime.now()}
+        if entry is None:
+            return
+
+    st.caption(f"Live: updated {entry['updated_at']:%H:%M:%S}, {watching}.")
+    if entry["delta"] is not None:
+        added, changed, removed = entry["delta"]
+        if len(added) or len(changed) or len(removed):
+            st.info(f"Last update: {len(added)} new, {len(changed)} changed, {len(removed)} removed row(s).")
+            with st.expander("Changed rows"):
+                if len(added) or len(changed):
+                    st.dataframe(pd.concat([added, changed]), hide_index=True)
+                if len(removed):
+                    st.write("Removed:")
+                    st.dataframe(removed, hide_index=True)
+    if not entry["df"].empty:
+        st.dataframe(entry["df"], hide_index=True)
+    else:
+        st.warning("No data available for the selected query.")
 
 # ---------------------------#
 #         App Layout         #
@@ -142,7 +1993,8 @@ query_categories = {
                     br.title, 
                     b.due_date, 
                     b.penalty,
-                    (b.penalty + (CURRENT_DATE - b.due_date) * 0.5) AS fine_amount
+                    -- penalty already holds the fines accrued nightly (Fines.sql); add the days since the last run
+                    (b.penalty + (CURRENT_DATE - GREATEST(COALESCE(b.fine_accrued_through, b.due_date), b.due_date)) * fine_daily_rate()) AS fine_amount
                 FROM borrows b
                 JOIN customer c ON b.username = c.username
                 JOIN books_for_rent br ON b.bookid = br.bookid
@@ -151,6 +2003,11 @@ query_categories = {
             """,
             "requires_params": False
         },
+        "Rental Demand Forecast & Copies to Move from Sale": {
+            # No single query: computed by get_rental_demand_forecast() from RENTAL_LOANS_SQL and RENTAL_STOCK_SQL
+            "computed": True,
+            "requires_params": False
+        },
         "Branch with the Highest Number of Rentals": {
             "query": """
                 SELECT b.branchid, COUNT(br.bookid) AS rentals_count
@@ -190,29 +2047,8 @@ query_categories = {
             "requires_params": False
         },
         "Categorize Customers into Segments": {
-            "query": """
-                WITH customer_spend AS ( 
-                    SELECT 
-                        c.username, 
-                        COALESCE(SUM(b.quantity * bs.price), 0) + COALESCE(SUM(i.quantity * it.price), 0) AS total_spending
-                    FROM 
-                        customer c
-                    LEFT JOIN buys_books b ON c.username = b.username
-                    LEFT JOIN books_for_sale bs ON b.isbn = bs.isbn
-                    LEFT JOIN purchases_items i ON c.username = i.username
-                    LEFT JOIN items it ON i.barcode = it.barcode
-                    GROUP BY c.username
-                )
-                SELECT 
-                    username, 
-                    CASE 
-                        WHEN total_spending > 500 THEN 'High Spender'
-                        WHEN total_spending BETWEEN 200 AND 500 THEN 'Medium Spender'
-                        ELSE 'Low Spender'
-                    END AS customer_segment
-                FROM 
-                    customer_spend;
-            """,
+            # No single query: scored in-process by get_customer_segments() (see computed_reports)
+            "computed": True,
             "requires_params": False
         },
         "View Customers With Penalties": {
@@ -389,21 +2225,91 @@ query_categories = {
     }
 }
 
-# Define tables for "View All" buttons per category
+# Reports computed in Python from their query's data instead of being run directly
+computed_reports = {
+    "Categorize Customers into Segments": get_customer_segments,
+    "Rental Demand Forecast & Copies to Move from Sale": get_rental_demand_forecast,
+}
+
+# Queries of the "My Account" page, run through run_tenant_query so row-level security scopes them
+MY_ACCOUNT_ROW_LIMIT = 500
+MY_ACCOUNT_QUERIES = {
+    "Loans": """
+        SELECT b.username, b.bookid, br.title, b.date_out, b.due_date, b.penalty, b.status
+        FROM borrows b
+        JOIN books_for_rent br ON br.bookid = b.bookid
+        ORDER BY b.date_out DESC
+        LIMIT %s;
+    """,
+    "Book Purchases": """
+        SELECT bb.username, bb.isbn, bfs.title, bb.branchid, bb.quantity, bfs.price * bb.quantity AS total, bb.date_time
+        FROM buys_books bb
+        JOIN books_for_sale bfs ON bfs.isbn = bb.isbn
+        ORDER BY bb.date_time DESC
+        LIMIT %s;
+    """,
+    "Item Purchases": """
+        SELECT pi.username, pi.barcode, i.items_name, pi.branchid, pi.quantity, i.price * pi.quantity AS total, pi.date_time
+        FROM purchases_items pi
+        JOIN items i ON i.barcode = pi.barcode
+        ORDER BY pi.date_time DESC
+        LIMIT %s;
+    """,
+}
+
+# Define tables for "View All" buttons per category (never authentication_system: its rows hold the passcodes)
 view_all_tables = {
-    "Book Rentals & Branch Performance": ["authentication_system", "books_for_rent", "libraryy"],
-    "Customer Insights": ["customer", "authentication_system"],
+    "Book Rentals & Branch Performance": ["books_for_rent", "libraryy"],
+    "Customer Insights": ["customer"],
     "Supplier & Revenue Analysis": ["supplier", "publisher", "items", "books_for_sale"],
     "Staff & Inventory Management": ["staff", "dependents"],
 }
 
 # Sidebar for Navigation with Dropdown
 st.sidebar.title("Navigation")
-categories = list(query_categories.keys()) + ["Add Data", "About"]
+categories = list(query_categories.keys()) + ["Time-Series Analytics", "Recommendations", "My Account", "Add Data", "About"]
 selected_category = st.sidebar.selectbox("Select a Category", categories)
 
+# Sidebar login
+st.sidebar.title("Account")
+identity = current_identity()
+if identity:
+    st.sidebar.write(f"Signed in as **{identity['email']}** ({identity['role']})")
+    if st.sidebar.button("Log Out"):
+        get_session_cache().discard(st.session_state.pop("auth_token"))
+        st.rerun()
+else:
+    with st.sidebar.form("login_form", clear_on_submit=True):
+        login_email = st.text_input("Email")
+        login_passcode = st.text_input("Passcode", type="password")
+        login_submit = st.form_submit_button("Log In")
+    if login_submit:
+        identity = verify_credentials(login_email, login_passcode) if login_email and login_passcode else None
+        if identity:
+            st.session_state["auth_token"] = get_session_cache().put(identity)
+            st.rerun()
+        else:
+            st.sidebar.error("Invalid email or passcode.")
+
+# Report data source: live database or the columnar snapshot
+st.sidebar.title("Report Data Source")
+snapshot_manifest = read_snapshot_manifest()
+if snapshot_manifest:
+    data_source = st.sidebar.radio("Run reports on", ["Live", "Snapshot"], horizontal=True)
+    st.sidebar.caption(f"Snapshot taken {snapshot_age_text(snapshot_manifest)}")
+else:
+    data_source = "Live"
+    st.sidebar.caption("No snapshot yet; reports run on the live database.")
+if get_circuit_breaker().is_open:
+    st.sidebar.warning("The database is under strain: reports show their last results until it recovers.")
+if identity and identity["role"] == "Staff":
+    if st.sidebar.button("Refresh Snapshot"):
+        with st.spinner("Refreshing snapshot..."):
+            if refresh_snapshot():
+                st.rerun()
+
 # Main Content Area
-if selected_category not in ["About", "Add Data"]:
+if selected_category not in ["About", "Add Data", "Time-Series Analytics", "Recommendations", "My Account"]:
     st.header(f"🔍 {selected_category}")
     
     queries = query_categories[selected_category]
@@ -414,7 +2320,7 @@ if selected_category not in ["About", "Add Data"]:
         selected_query = st.selectbox("Select a Query", query_names)
         
         query_details = queries[selected_query]
-        query_sql = query_details["query"]
+        query_sql = query_details.get("query")   # None for computed reports
         requires_params = query_details.get("requires_params", False)
         
         if requires_params:
@@ -425,28 +2331,35 @@ if selected_category not in ["About", "Add Data"]:
                     if param == "Book Title":
                         params["book_title"] = st.text_input("Book Title")
                     elif param == "Branch ID":
-                        params["branch_id"] = st.text_input("Branch ID")
+                        params["branch_id"] = lookup_input("Branch ID", "branchid")
                     elif param == "From Branch ID":
-                        params["from_branch_id"] = st.text_input("From Branch ID")
+                        params["from_branch_id"] = lookup_input("From Branch ID", "branchid")
                     elif param == "To Branch ID":
-                        params["to_branch_id"] = st.text_input("To Branch ID")
+                        params["to_branch_id"] = lookup_input("To Branch ID", "branchid")
                     elif param == "Book ISBN":
-                        params["book_isbn"] = st.text_input("Book ISBN (13 characters)")
+                        params["book_isbn"] = lookup_input("Book ISBN (13 characters)", "isbn")
                     elif param == "Transfer Quantity":
                         params["transfer_qty"] = st.number_input("Transfer Quantity", min_value=1, step=1)
                     elif param == "Book ID (Format: ISBN#ID)":
-                        params["book_id"] = st.text_input("Book ID (Format: ISBN#ID)")
+                        params["book_id"] = lookup_input("Book ID (Format: ISBN#ID)", "bookid")
                 submit_button = st.form_submit_button("Execute")
             
             if submit_button:
                 # Validate inputs
                 missing_params = [p for p in params if not params[p]]
+                lookup_params = {
+                    "branch_id": "branchid",
+                    "from_branch_id": "branchid",
+                    "to_branch_id": "branchid",
+                    "book_isbn": "isbn",
+                    "book_id": "bookid",
+                }
                 if missing_params:
                     st.warning(f"Please provide: {', '.join(missing_params)}")
-                else:
+                elif not unknown_lookup_values(*[(lookup_params[p], params[p]) for p in params if p in lookup_params]):
                     if selected_query == "Check Book Availability":
                         # Execute the function and display availability
-                        df = run_query(query_sql, (params["book_title"], params["branch_id"]))
+                        df = run_query(query_sql, (params["book_title"], params["branch_id"]), replica_ok=True)
                         if not df.empty and df.iloc[0,0]:
                             availability = "Yes"
                         else:
@@ -457,7 +2370,7 @@ if selected_category not in ["About", "Add Data"]:
                     
                     elif selected_query == "Calculate Total Inventory Value":
                         # Execute the function and display total inventory value
-                        df = run_query(query_sql, (params["branch_id"],))
+                        df = run_query(query_sql, (params["branch_id"],), replica_ok=True)
                         if not df.empty:
                             total_value = df.iloc[0,0]
                             st.write(f"**Branch ID:** {params['branch_id']}")
@@ -476,7 +2389,7 @@ if selected_category not in ["About", "Add Data"]:
                     
                     elif selected_query == "Track Borrowing Chains for a Book":
                         # Execute the recursive query and plot
-                        df = run_query(query_sql, (params["book_id"],))
+                        df = run_query(query_sql, (params["book_id"],), replica_ok=True)
                         if not df.empty:
                             st.write(f"**Borrowing Chain for Book ID:** {params['book_id']}")
                             st.dataframe(df)
@@ -499,15 +2412,35 @@ if selected_category not in ["About", "Add Data"]:
         
         else:
             # Queries that do not require parameters
-            with st.form(f"form_{selected_query.replace(' ', '_')}", clear_on_submit=True):
-                submit_button = st.form_submit_button("Run Query")
+            live = (
+                selected_query not in computed_reports
+                and data_source == "Live"
+                and DB_SETTINGS is not None
+                and st.checkbox("Live updates", key=f"live_{selected_query}", help="Keep this report current as the data changes.")
+            )
+            if live:
+                st.subheader(selected_query)
+                live_report(selected_query, query_sql)
+                submit_button = False
+            else:
+                with st.form(f"form_{selected_query.replace(' ', '_')}", clear_on_submit=True):
+                    submit_button = st.form_submit_button("Run Query")
             
             if submit_button:
-                df = run_query(query_sql)
+                table = None
+                if selected_query in computed_reports:
+                    df = computed_reports[selected_query]()
+                elif data_source == "Snapshot":
+                    df = run_snapshot_query(query_sql)
+                    st.caption(f"Served from snapshot taken {snapshot_age_text(snapshot_manifest)}")
+                else:
+                    # Arrow for the table view, a DataFrame for the charts below
+                    table = run_analytics_table(query_sql)
+                    df = table.to_pandas()
                 
                 if not df.empty:
                     st.subheader(selected_query)
-                    st.dataframe(df)
+                    st.dataframe(table if table is not None else df)
                     
                     # Plotting with Plotly for better customization
                     if selected_category == "Book Rentals & Branch Performance":
@@ -524,6 +2457,24 @@ if selected_category not in ["About", "Add Data"]:
                                 )
                                 fig.update_layout(showlegend=False)
                                 st.plotly_chart(fig, use_container_width=True)
+                        elif selected_query == "Rental Demand Forecast & Copies to Move from Sale":
+                            if 'title' in df.columns and 'copies_to_move' in df.columns:
+                                top_demand = df[df['copies_to_move'] > 0].head(15)
+                                if top_demand.empty:
+                                    st.info("Current rental copies cover the forecast demand for every title.")
+                                else:
+                                    fig = px.bar(
+                                        top_demand,
+                                        x='title',
+                                        y='copies_to_move',
+                                        title="Copies to Move from Sale to Rent",
+                                        labels={'title': 'Book Title', 'copies_to_move': 'Copies to Move', 'utilization': 'Utilization'},
+                                        color='utilization',
+                                        color_continuous_scale='Viridis',
+                                        hover_data=['copies', 'forecast_next_month', 'saturated_days']
+                                    )
+                                    fig.update_layout(showlegend=False)
+                                    st.plotly_chart(fig, use_container_width=True)
                         elif selected_query == "Branch with the Highest Number of Rentals":
                             if 'branchid' in df.columns and 'rentals_count' in df.columns:
                                 fig = px.bar(
@@ -675,25 +2626,147 @@ if selected_category not in ["About", "Add Data"]:
                     st.session_state[toggle_key] = not st.session_state[toggle_key]
                 if st.session_state[toggle_key]:
                     with st.expander(f"All Records from {table.replace('_', ' ').title()}"):
+                        if table in REFERENCE_TABLES:
+                            # Served from the process-wide reference data cache without a database round trip
+                            df_all = get_reference_data().frame(table)
+                            if df_all is not None and not df_all.empty:
+                                st.dataframe(df_all, hide_index=True)
+                            elif df_all is not None:
+                                st.warning(f"No data available in {table.replace('_', ' ').title()} table.")
+                            continue
                         # Safely construct the SQL query with proper casing
                         view_all_query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(table))
-                        try:
-                            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                                cur.execute(view_all_query)
-                                records = cur.fetchall()
-                                if records:
-                                    df_all = pd.DataFrame(records)
-                                    st.dataframe(df_all)
-                                    
-                                    # Optional: Add Plotly visualizations based on the table
-                                    # (Include your plotting code here if needed)
-                                else:
-                                    st.warning(f"No data available in {table.replace('_', ' ').title()} table.")
-                        except Exception as e:
-                            st.error(f"Error fetching data from {table.replace('_', ' ').title()}: {e}")
+                        table_all = run_analytics_table(view_all_query)
+                        if table_all.num_rows > 0:
+                            st.dataframe(table_all)
+                            
+                            # Optional: Add Plotly visualizations based on the table
+                            # (Include your plotting code here if needed)
+                        else:
+                            st.warning(f"No data available in {table.replace('_', ' ').title()} table.")
+
+elif selected_category == "Time-Series Analytics":
+    st.header("📈 Time-Series Analytics")
+
+    with st.form("time_series_form"):
+        metric = st.selectbox("Metric", list(TIME_SERIES_METRICS.keys()))
+        date_range = st.date_input(
+            "Date Range",
+            value=(pd.Timestamp.today().date() - pd.Timedelta(days=365), pd.Timestamp.today().date())
+        )
+        granularity = st.selectbox("Granularity", TIME_SERIES_GRANULARITIES, format_func=str.title)
+        split = st.selectbox("Split By", ["None", "Branch", "ISBN / Barcode"])
+        submit_button = st.form_submit_button("Run Query")
+
+    if submit_button:
+        if len(date_range) != 2:
+            st.warning("Please select both a start and an end date.")
+        else:
+            group_by = {
+                "None": None,
+                "Branch": "branchid",
+                "ISBN / Barcode": TIME_SERIES_METRICS[metric]["key"],
+            }[split]
+            df = run_time_series(metric, date_range[0], date_range[1], granularity, group_by)
+            color_col = group_by
+            if not df.empty and group_by in ("isbn", "barcode"):
+                # Label the split with titles / item names joined in memory from the reference data
+                label_table, color_col = ("books_for_sale", "title") if group_by == "isbn" else ("items", "items_name")
+                df.insert(1, color_col, get_reference_data().labels(label_table, df[group_by], color_col))
+            if not df.empty:
+                value_col = TIME_SERIES_METRICS[metric]["value"]
+                st.subheader(f"{metric} per {granularity.title()}")
+                st.dataframe(df)
+                fig = px.line(
+                    df,
+                    x='period',
+                    y=value_col,
+                    color=color_col,
+                    line_group=group_by,
+                    markers=True,
+                    title=f"{metric} per {granularity.title()}",
+                    labels={'period': granularity.title(), value_col: metric, 'branchid': 'Branch ID'}
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.warning("No data available for the selected range.")
+
+elif selected_category == "Recommendations":
+    st.header("📖 Recommendations")
+
+    recommender = get_book_recommender()
+    if recommender is None:
+        pass   # the error is shown; the next rerun loads again
+    elif not recommender.neighbours:
+        st.info("No recommendations have been computed yet. A staff member can build them below.")
+    else:
+        mode = st.radio("Recommend", ["Similar Books", "For a Customer"], horizontal=True)
+        if mode == "Similar Books":
+            isbn = st.selectbox(
+                "Book",
+                recommender.isbns(),
+                index=None,
+                placeholder="Type to search...",
+                format_func=lambda i: f"{recommender.titles.get(i, '')} ({i})"
+            )
+            results = recommender.similar_books(isbn) if isbn else None
+            subject = f"Patrons who borrowed or bought {recommender.titles.get(isbn, isbn)} also chose"
+        else:
+            username = lookup_input("Username", "username")
+            results = recommender.for_customer(username) if username else None
+            subject = f"Recommended for {username}"
+
+        if results is not None:
+            if results:
+                df = pd.DataFrame(results, columns=["isbn", "title", "score"])
+                st.subheader(subject)
+                st.dataframe(df)
+                fig = px.bar(
+                    df,
+                    x='score',
+                    y='title',
+                    orientation='h',
+                    title=subject,
+                    labels={'score': 'Similarity Score', 'title': 'Book Title'},
+                    color='score',
+                    color_continuous_scale='Teal'
+                )
+                fig.update_layout(showlegend=False, yaxis={'categoryorder': 'total ascending'})
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.warning("Not enough borrowing or purchase history to recommend anything yet.")
+
+    if identity and identity["role"] == "Staff":
+        if st.button("Rebuild Recommendations"):
+            if rebuild_book_neighbours():
+                st.rerun()
+
+elif selected_category == "My Account":
+    st.header("👤 My Account")
+
+    if identity is None:
+        st.info("Log in to see your loans and purchases.")
+        st.stop()
+
+    # No username filters here: row-level security limits customers to their own rows, while staff see everyone's
+    if identity["role"] == "Customer":
+        st.caption(f"Loans and purchases of {identity['username']}")
+    else:
+        st.caption(f"Most recent {MY_ACCOUNT_ROW_LIMIT} loans and purchases of all customers")
+    for tab, (name, query) in zip(st.tabs(list(MY_ACCOUNT_QUERIES.keys())), MY_ACCOUNT_QUERIES.items()):
+        with tab:
+            df = run_tenant_query(identity, query, (MY_ACCOUNT_ROW_LIMIT,))
+            if not df.empty:
+                st.dataframe(df, hide_index=True)
+            else:
+                st.info(f"No {name.lower()} yet.")
 
 elif selected_category == "Add Data":
     st.header("📝 Add Data")
+
+    if REQUIRE_STAFF_LOGIN_FOR_ADD_DATA and (identity is None or identity["role"] != "Staff"):
+        st.info("Log in with a staff account to add or update data.")
+        st.stop()
     
     # Subcategories for adding data
     add_data_categories = [
@@ -715,10 +2788,16 @@ elif selected_category == "Add Data":
         "Purchases_Items",
         "Borrows",
         "Sale_to_Rent",
+        "Bulk Sale_to_Rent",
         "Update Borrows Status"
     ]
     
     selected_add_category = st.selectbox("Select a Table to Add/Update Data", add_data_categories)
+    st.checkbox(
+        "Stage changes and commit them together",
+        key="stage_writes",
+        help="Queue rows from several tables (e.g. a book, its authors and its stock), review them, then save them in one transaction."
+    )
     
     if selected_add_category == "Authentication_System":
         st.subheader("Add Authentication System Data")
@@ -728,14 +2807,14 @@ elif selected_category == "Add Data":
             submit = st.form_submit_button("Add")
         if submit:
             if email and passcode:
-                # Encrypt the passcode using pgp_sym_encrypt
+                # Store a salted bcrypt hash of the passcode (see Security Mechanism 5 in BONUSES.sql)
                 insert_sql = """
-                    INSERT INTO authentication_system (email, passcode)
-                    VALUES (%s, pgp_sym_encrypt(%s, %s))
+                    INSERT INTO authentication_system (email, passcode_hash)
+                    VALUES (%s, crypt(%s, gen_salt('bf', %s)))
                     ON CONFLICT (email) 
                     DO NOTHING;
                 """
-                execute_query(insert_sql, (email, passcode, ENCRYPTION_KEY))
+                save_row(selected_add_category, insert_sql, (email, passcode, PASSCODE_HASH_COST), summary=email)
             else:
                 st.warning("Please fill in all fields.")
     
@@ -758,7 +2837,7 @@ elif selected_category == "Add Data":
                     ON CONFLICT (username) 
                     DO NOTHING;
                 """
-                execute_query(insert_sql, (username, phone_number, address, sex, first_name, last_name, ct_email))
+                save_row(selected_add_category, insert_sql, (username, phone_number, address, sex, first_name, last_name, ct_email), lookup=("username", username))
             else:
                 st.warning("Please fill in all required fields.")
     
@@ -777,7 +2856,7 @@ elif selected_category == "Add Data":
                     ON CONFLICT (branchid) 
                     DO NOTHING;
                 """
-                execute_query(insert_sql, (branch_id, address, phone_number))
+                save_row(selected_add_category, insert_sql, (branch_id, address, phone_number), lookup=("branchid", branch_id))
             else:
                 st.warning("Please fill in all fields.")
     
@@ -794,18 +2873,19 @@ elif selected_category == "Add Data":
             post = st.selectbox("Post", ["Manager", "Librarian", "Assistant"])
             super_ssn = st.text_input("Supervisor SSN")
             st_email = st.text_input("Staff Email (Authentication_System Email)")
-            branch_id = st.text_input("Branch ID")
+            branch_id = lookup_input("Branch ID", "branchid")
             hours = st.number_input("Hours Worked", min_value=0, step=1)
             submit = st.form_submit_button("Add")
         if submit:
             if ssn and first_name and last_name and blood_type and address and salary and post and st_email and branch_id and hours is not None:
-                insert_sql = """
-                    INSERT INTO staff (ssn, first_name, last_name, dob, blood_type, address, salary, post, super_ssn, st_email, branchid, hours)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (ssn) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (ssn, first_name, last_name, dob, blood_type, address, salary, post, super_ssn, st_email, branch_id, hours))
+                if not unknown_lookup_values(("branchid", branch_id)):
+                    insert_sql = """
+                        INSERT INTO staff (ssn, first_name, last_name, dob, blood_type, address, salary, post, super_ssn, st_email, branchid, hours)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (ssn) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (ssn, first_name, last_name, dob, blood_type, address, salary, post, super_ssn, st_email, branch_id, hours))
             else:
                 st.warning("Please fill in all required fields.")
     
@@ -825,7 +2905,7 @@ elif selected_category == "Add Data":
                     ON CONFLICT (ssn, dep_name) 
                     DO NOTHING;
                 """
-                execute_query(insert_sql, (ssn, dep_name, relationship, sex))
+                save_row(selected_add_category, insert_sql, (ssn, dep_name, relationship, sex))
             else:
                 st.warning("Please fill in all fields.")
     
@@ -844,7 +2924,7 @@ elif selected_category == "Add Data":
                     ON CONFLICT (supp_name, address) 
                     DO NOTHING;
                 """
-                execute_query(insert_sql, (supp_name, address, phone_number))
+                save_row(selected_add_category, insert_sql, (supp_name, address, phone_number))
             else:
                 st.warning("Please fill in all fields.")
     
@@ -863,7 +2943,7 @@ elif selected_category == "Add Data":
                     ON CONFLICT (publisher_name) 
                     DO NOTHING;
                 """
-                execute_query(insert_sql, (publisher_name, address, phone_number))
+                save_row(selected_add_category, insert_sql, (publisher_name, address, phone_number))
             else:
                 st.warning("Please fill in all fields.")
     
@@ -882,13 +2962,14 @@ elif selected_category == "Add Data":
             submit = st.form_submit_button("Add")
         if submit:
             if barcode and items_name and price:
-                insert_sql = """
-                    INSERT INTO items (barcode, items_name, age_group, price, genre, supp_name, supp_address, qty_supplied, date_supplied)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (barcode) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (barcode, items_name, age_group, price, genre, supp_name, supp_address, qty_supplied, date_supplied))
+                if not (supp_name and unknown_reference_values("supplier", supp_name, label="supplier")):
+                    insert_sql = """
+                        INSERT INTO items (barcode, items_name, age_group, price, genre, supp_name, supp_address, qty_supplied, date_supplied)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (barcode) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (barcode, items_name, age_group, price, genre, supp_name, supp_address, qty_supplied, date_supplied))
             else:
                 st.warning("Please fill in all required fields.")
     
@@ -907,13 +2988,14 @@ elif selected_category == "Add Data":
             submit = st.form_submit_button("Add")
         if submit:
             if isbn and title and genre and price and edition and pages and lang:
-                insert_sql = """
-                    INSERT INTO books_for_sale (isbn, title, genre, price, translator, edition, pages, lang, publisher_name)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (isbn) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (isbn, title, genre, price, translator, edition, pages, lang, publisher_name))
+                if not (publisher_name and unknown_reference_values("publisher", publisher_name, label="publisher")):
+                    insert_sql = """
+                        INSERT INTO books_for_sale (isbn, title, genre, price, translator, edition, pages, lang, publisher_name)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (isbn) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (isbn, title, genre, price, translator, edition, pages, lang, publisher_name), lookup=("isbn", isbn))
             else:
                 st.warning("Please fill in all required fields.")
     
@@ -932,141 +3014,148 @@ elif selected_category == "Add Data":
             publisher_name = st.text_input("Publisher Name")
             shelf_no = st.number_input("Shelf Number", min_value=1, step=1)
             row_no = st.number_input("Row Number", min_value=1, step=1)
-            branch_id = st.text_input("Branch ID")
+            branch_id = lookup_input("Branch ID", "branchid")
             submit = st.form_submit_button("Add")
         if submit:
             if book_id and isbn and title and genre and price and edition and pages and lang and shelf_no and row_no and branch_id:
-                insert_sql = """
-                    INSERT INTO books_for_rent (bookid, isbn, title, genre, price, translator, edition, pages, lang, publisher_name, shelf_no, row_no, branchid)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (bookid) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (book_id, isbn, title, genre, price, translator, edition, pages, lang, publisher_name, shelf_no, row_no, branch_id))
+                if not unknown_lookup_values(("branchid", branch_id)):
+                    insert_sql = """
+                        INSERT INTO books_for_rent (bookid, isbn, title, genre, price, translator, edition, pages, lang, publisher_name, shelf_no, row_no, branchid)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (bookid) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (book_id, isbn, title, genre, price, translator, edition, pages, lang, publisher_name, shelf_no, row_no, branch_id), lookup=("bookid", book_id))
             else:
                 st.warning("Please fill in all required fields.")
     
     elif selected_add_category == "Authors_BookSale":
         st.subheader("Add Authors for Book Sale Data")
         with st.form("add_authors_booksale", clear_on_submit=True):
-            isbn = st.text_input("ISBN (13 characters)")
+            isbn = lookup_input("ISBN (13 characters)", "isbn")
             author_name = st.text_input("Author Name")
             submit = st.form_submit_button("Add")
         if submit:
             if isbn and author_name:
-                insert_sql = """
-                    INSERT INTO authors_booksale (isbn, author_name)
-                    VALUES (%s, %s)
-                    ON CONFLICT (isbn, author_name) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (isbn, author_name))
+                if not unknown_lookup_values(("isbn", isbn)):
+                    insert_sql = """
+                        INSERT INTO authors_booksale (isbn, author_name)
+                        VALUES (%s, %s)
+                        ON CONFLICT (isbn, author_name) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (isbn, author_name))
             else:
                 st.warning("Please fill in all fields.")
     
     elif selected_add_category == "Authors_BookRent":
         st.subheader("Add Authors for Book Rent Data")
         with st.form("add_authors_bookrent", clear_on_submit=True):
-            book_id = st.text_input("Book ID (Format: ISBN#ID)")
+            book_id = lookup_input("Book ID (Format: ISBN#ID)", "bookid")
             author_name = st.text_input("Author Name")
             submit = st.form_submit_button("Add")
         if submit:
             if book_id and author_name:
-                insert_sql = """
-                    INSERT INTO authors_bookrent (bookid, author_name)
-                    VALUES (%s, %s)
-                    ON CONFLICT (bookid, author_name) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (book_id, author_name))
+                if not unknown_lookup_values(("bookid", book_id)):
+                    insert_sql = """
+                        INSERT INTO authors_bookrent (bookid, author_name)
+                        VALUES (%s, %s)
+                        ON CONFLICT (bookid, author_name) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (book_id, author_name))
             else:
                 st.warning("Please fill in all fields.")
     
     elif selected_add_category == "Stores_Items":
         st.subheader("Add Stores Items Data")
         with st.form("add_stores_items", clear_on_submit=True):
-            branch_id = st.text_input("Branch ID")
+            branch_id = lookup_input("Branch ID", "branchid")
             barcode = st.text_input("Barcode")
             qty_stored = st.number_input("Quantity Stored", min_value=0, step=1)
             submit = st.form_submit_button("Add")
         if submit:
             if branch_id and barcode and qty_stored is not None:
-                insert_sql = """
-                    INSERT INTO stores_items (branchid, barcode, qty_stored)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (branchid, barcode) 
-                    DO UPDATE SET qty_stored = stores_items.qty_stored + EXCLUDED.qty_stored;
-                """
-                execute_query(insert_sql, (branch_id, barcode, qty_stored))
+                if not unknown_lookup_values(("branchid", branch_id)) and not unknown_reference_values("items", barcode, label="barcode"):
+                    insert_sql = """
+                        INSERT INTO stores_items (branchid, barcode, qty_stored)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (branchid, barcode) 
+                        DO UPDATE SET qty_stored = stores_items.qty_stored + EXCLUDED.qty_stored;
+                    """
+                    save_row(selected_add_category, insert_sql, (branch_id, barcode, qty_stored))
             else:
                 st.warning("Please fill in all fields.")
     
     elif selected_add_category == "Stores_Booksforsale":
         st.subheader("Add Stores Booksforsale Data")
         with st.form("add_stores_booksforsale", clear_on_submit=True):
-            branch_id = st.text_input("Branch ID")
-            isbn = st.text_input("ISBN (13 characters)")
+            branch_id = lookup_input("Branch ID", "branchid")
+            isbn = lookup_input("ISBN (13 characters)", "isbn")
             number_of_copies = st.number_input("Number of Copies", min_value=0, step=1)
             submit = st.form_submit_button("Add")
         if submit:
             if branch_id and isbn and number_of_copies is not None:
-                insert_sql = """
-                    INSERT INTO stores_booksforsale (branchid, isbn, number_of_copies)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (branchid, isbn) 
-                    DO UPDATE SET number_of_copies = stores_booksforsale.number_of_copies + EXCLUDED.number_of_copies;
-                """
-                execute_query(insert_sql, (branch_id, isbn, number_of_copies))
+                if not unknown_lookup_values(("branchid", branch_id), ("isbn", isbn)):
+                    insert_sql = """
+                        INSERT INTO stores_booksforsale (branchid, isbn, number_of_copies)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (branchid, isbn) 
+                        DO UPDATE SET number_of_copies = stores_booksforsale.number_of_copies + EXCLUDED.number_of_copies;
+                    """
+                    save_row(selected_add_category, insert_sql, (branch_id, isbn, number_of_copies))
             else:
                 st.warning("Please fill in all fields.")
     
     elif selected_add_category == "Buys_Books":
         st.subheader("Add Buys Books Data")
         with st.form("add_buys_books", clear_on_submit=True):
-            username = st.text_input("Username")
-            branch_id = st.text_input("Branch ID")
-            isbn = st.text_input("ISBN (13 characters)")
+            username = lookup_input("Username", "username")
+            branch_id = lookup_input("Branch ID", "branchid")
+            isbn = lookup_input("ISBN (13 characters)", "isbn")
             quantity = st.number_input("Quantity", min_value=0, step=1)
             date_time = st.date_input("Date and Time")
             submit = st.form_submit_button("Add")
         if submit:
             if username and branch_id and isbn and quantity is not None and date_time:
-                insert_sql = """
-                    INSERT INTO buys_books (username, branchid, isbn, quantity, date_time)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (username, branchid, isbn, date_time) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (username, branch_id, isbn, quantity, date_time))
+                if not unknown_lookup_values(("username", username), ("branchid", branch_id), ("isbn", isbn)):
+                    insert_sql = """
+                        INSERT INTO buys_books (username, branchid, isbn, quantity, date_time)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (username, branchid, isbn, date_time) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (username, branch_id, isbn, quantity, date_time))
             else:
                 st.warning("Please fill in all required fields.")
     
     elif selected_add_category == "Purchases_Items":
         st.subheader("Add Purchases Items Data")
         with st.form("add_purchases_items", clear_on_submit=True):
-            username = st.text_input("Username")
-            branch_id = st.text_input("Branch ID")
+            username = lookup_input("Username", "username")
+            branch_id = lookup_input("Branch ID", "branchid")
             barcode = st.text_input("Barcode")
             quantity = st.number_input("Quantity", min_value=0, step=1)
             date_time = st.date_input("Date and Time")
             submit = st.form_submit_button("Add")
         if submit:
             if username and branch_id and barcode and quantity is not None and date_time:
-                insert_sql = """
-                    INSERT INTO purchases_items (username, branchid, barcode, quantity, date_time)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (username, branchid, barcode, date_time) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (username, branch_id, barcode, quantity, date_time))
+                if not unknown_lookup_values(("username", username), ("branchid", branch_id)) and not unknown_reference_values("items", barcode, label="barcode"):
+                    insert_sql = """
+                        INSERT INTO purchases_items (username, branchid, barcode, quantity, date_time)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (username, branchid, barcode, date_time) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (username, branch_id, barcode, quantity, date_time))
             else:
                 st.warning("Please fill in all required fields.")
     
     elif selected_add_category == "Borrows":
         st.subheader("Add Borrows Data")
         with st.form("add_borrows", clear_on_submit=True):
-            username = st.text_input("Username")
-            book_id = st.text_input("Book ID (Format: ISBN#ID)")
+            username = lookup_input("Username", "username")
+            book_id = lookup_input("Book ID (Format: ISBN#ID)", "bookid")
             date_out = st.date_input("Date Out")
             due_date = st.date_input("Due Date")
             penalty = st.number_input("Penalty", min_value=0.0, step=0.01)
@@ -1074,13 +3163,14 @@ elif selected_category == "Add Data":
             submit = st.form_submit_button("Add")
         if submit:
             if username and book_id and date_out and due_date and status:
-                insert_sql = """
-                    INSERT INTO borrows (username, bookid, date_out, due_date, penalty, status)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (username, bookid, date_out) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (username, book_id, date_out, due_date, penalty, status))
+                if not unknown_lookup_values(("username", username), ("bookid", book_id)):
+                    insert_sql = """
+                        INSERT INTO borrows (username, bookid, date_out, due_date, penalty, status)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (username, bookid, date_out) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (username, book_id, date_out, due_date, penalty, status))
             else:
                 st.warning("Please fill in all required fields.")
     
@@ -1088,42 +3178,92 @@ elif selected_category == "Add Data":
         st.subheader("Add Sale to Rent Data")
         with st.form("add_sale_to_rent", clear_on_submit=True):
             book_id = st.text_input("Book ID (Format: ISBN#ID)")
-            isbn = st.text_input("ISBN (13 characters)")
+            isbn = lookup_input("ISBN (13 characters)", "isbn")
             date_moved = st.date_input("Date Moved")
             discount = st.number_input("Discount (%)", min_value=0.0, max_value=100.0, step=0.01)
             submit = st.form_submit_button("Add")
         if submit:
             if book_id and isbn and date_moved is not None:
-                insert_sql = """
-                    INSERT INTO sale_to_rent (bookid, isbn, date_moved, discount)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (bookid, isbn) 
-                    DO NOTHING;
-                """
-                execute_query(insert_sql, (book_id, isbn, date_moved, discount))
+                if not unknown_lookup_values(("isbn", isbn)):
+                    insert_sql = """
+                        INSERT INTO sale_to_rent (bookid, isbn, date_moved, discount)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (bookid, isbn) 
+                        DO NOTHING;
+                    """
+                    save_row(selected_add_category, insert_sql, (book_id, isbn, date_moved, discount), lookup=("bookid", book_id))
             else:
                 st.warning("Please fill in all required fields.")
     
+    elif selected_add_category == "Bulk Sale_to_Rent":
+        st.subheader("Move a Batch of Copies from Sale to Rent")
+        st.caption("Enter one Book ID (Format: ISBN#ID) per line, or upload a CSV file with a 'bookid' column.")
+        with st.form("bulk_sale_to_rent", clear_on_submit=True):
+            branch_id = lookup_input("Branch ID", "branchid")
+            book_ids_text = st.text_area("Book IDs (Format: ISBN#ID)")
+            book_ids_file = st.file_uploader("Or upload CSV", type=["csv"])
+            date_moved = st.date_input("Date Moved")
+            discount = st.number_input("Discount (%)", min_value=0.0, max_value=100.0, step=0.01)
+            submit = st.form_submit_button("Move Batch")
+        if submit:
+            book_ids = [line.strip() for line in book_ids_text.splitlines() if line.strip()]
+            if book_ids_file is not None:
+                csv_df = pd.read_csv(book_ids_file, dtype=str)
+                csv_df.columns = [c.strip().lower() for c in csv_df.columns]
+                if "bookid" in csv_df.columns:
+                    book_ids += csv_df["bookid"].dropna().str.strip().tolist()
+                else:
+                    st.warning("The CSV file has no 'bookid' column.")
+            if branch_id and book_ids and date_moved is not None:
+                if not unknown_lookup_values(("branchid", branch_id)):
+                    if call_procedure("bulk_sale_to_rent", (branch_id, book_ids, date_moved, discount)):
+                        for book_id in book_ids:
+                            register_lookup_value("bookid", book_id)
+                        get_rental_demand_forecast.clear()
+                        st.write(f"**Copies moved to rent in {branch_id}:** {len(set(book_ids))}")
+            else:
+                st.warning("Please provide a branch and at least one Book ID.")
+
     elif selected_add_category == "Update Borrows Status":
         st.subheader("Update Borrows Status")
         with st.form("update_borrows_status_form", clear_on_submit=True):
-            username = st.text_input("Username")
-            book_id = st.text_input("Book ID (Format: ISBN#ID)")
+            username = lookup_input("Username", "username")
+            book_id = lookup_input("Book ID (Format: ISBN#ID)", "bookid")
             date_out = st.date_input("Date Out")
             new_status = st.selectbox("New Status", ["Borrowed", "Returned"])
             submit = st.form_submit_button("Update Status")
         if submit:
             if username and book_id and date_out and new_status:
-                update_sql = """
-                    UPDATE borrows
-                    SET status = %s
-                    WHERE username = %s AND bookid = %s AND date_out = %s;
-                """
-                execute_query(update_sql, (new_status, username, book_id, date_out))
-                st.success("Borrow status updated successfully.")
+                if not unknown_lookup_values(("username", username), ("bookid", book_id)):
+                    update_sql = """
+                        UPDATE borrows
+                        SET status = %s
+                        WHERE username = %s AND bookid = %s AND date_out = %s;
+                    """
+                    save_row(selected_add_category, update_sql, (new_status, username, book_id, date_out))
             else:
                 st.warning("Please fill in all required fields.")
 
+    # Preview and commit the session's unit of work (after the forms, so a row staged in this run is included)
+    committed = st.session_state.pop("committed_writes", None)
+    if committed:
+        st.success(f"Committed {committed} staged change(s) in one transaction.")
+    if staged_writes():
+        st.subheader(f"Staged Changes ({len(staged_writes())})")
+        st.dataframe(
+            pd.DataFrame([{"Table": w["table"], "Values": w["summary"]} for w in staged_writes()]),
+            use_container_width=True
+        )
+        col_commit, col_discard = st.columns(2)
+        if col_commit.button("Commit All"):
+            count = len(staged_writes())
+            if commit_staged_writes():
+                st.session_state["committed_writes"] = count
+                st.rerun()
+        if col_discard.button("Discard All"):
+            staged_writes().clear()
+            st.rerun()
+
 
 
 # About Section
@@ -1137,18 +3277,22 @@ elif selected_category == "About":
 
     #### Features:
     - **Book Rentals & Branch Performance:** Analyze top borrowed books, branch rentals, and overdue books.
-    - **Customer Insights:** Understand customer spending, segmentation, and purchasing behaviors.
+    - **Customer Insights:** Understand customer spending, RFM (recency, frequency, monetary) segmentation, and purchasing behaviors.
     - **Supplier & Revenue Analysis:** Evaluate supplier performance and overall revenue by branch.
+    - **Recommendations:** "Patrons who borrowed this also borrowed" suggestions per book and per customer.
+    - **Time-Series Analytics:** Chart borrows and sales over any date range by day, week or month from pre-aggregated daily totals.
     - **Staff & Inventory Management:** Manage staff performance and monitor inventory levels.
     - **Interactive Visualizations:** View data in tables and charts with colors and legends for better insights.
     - **View All Tables:** Easily view complete data from key tables in the database.
     - **Advanced Operations:** Perform operations like checking book availability, calculating inventory value, transferring book stock between branches, and tracking borrowing chains.
-    - **Add Data:** Insert new records into the database and update existing ones.
-    - **Security Mechanisms:** Enhanced security with encryption of passwords.
+    - **My Account:** Customers see their own loans and purchases, enforced by row-level security in the database.
+    - **Add Data:** Insert new records into the database and update existing ones, one at a time or staged and committed together in one transaction.
+    - **Security Mechanisms:** Enhanced security with salted password hashing and staff login for data entry.
     #### How to Use:
     1. **Select a Category:** Use the sidebar to navigate between different query categories.
     2. **Choose a Query:** Within each category, select the specific query you want to execute from the dropdown.
     3. **Run Query:** Click the "Run Query" button to execute and view results along with visualizations.
+       Tick "Live updates" to keep a report on screen and refreshed as the underlying tables change.
     4. **View All Tables:** Click on the "View All [Table]" buttons to see complete data from specific tables.
     5. **Add Data:** Navigate to the "Add Data" section to insert new records into the database and update existing ones.
     6. **Track Borrowing Chains:** Use the dedicated form to track the borrowing history of a specific book.
@@ -1156,7 +3300,7 @@ elif selected_category == "About":
     #### Setup Instructions:
     1. **Clone the Repository:** [Your Repository Link]
     2. **Install Dependencies:** `pip install -r requirements.txt`
-    3. **Configure Database Connection:** Ensure the connection parameters in `app.py` are correct or use `secrets.toml`.
+    3. **Configure Database Connection:** Set the `[postgres]` section (and optionally `[postgres_replica]`) in `.streamlit/secrets.toml`, or the `DB_*` environment variables.
     4. **Run the App:** `streamlit run app.py`
 
     #### Contact:
@@ -0,0 +1,512 @@
+# benchmark.py
+#
+# Micro-benchmarks for app.py's data layer, row-level security overhead, chart building, the shared
+# result cache, how CPU-bound post-processing scales across worker processes, and the Arrow result path
+# (time and peak memory from query to the bytes st.dataframe sends) against the row-by-row one.
+#
+# Runs against a DISPOSABLE local PostgreSQL database (it adds rows to the transaction tables):
+#   1. Create a scratch database and load create_table.sql, the sample rows from insert_data.sql, the
+#      triggers, functions and procedures from Views_Triggers_Functions_Procedures.sql, and Fines.sql
+#      (the overdue report needs it). Cases whose sample rows or schema are missing are skipped with a message.
+#   2. Point the app at it:  DB_HOST=127.0.0.1 DB_NAME=libtech_bench DB_USER=postgres DB_PASSWORD=...
+#   3. python benchmark.py --save-baseline          (first run, writes the baseline)
+#      python benchmark.py                          (later runs, fails on regressions)
+#
+# app.py is loaded as a plain module (Streamlit "bare mode"), so the benchmarks exercise the real
+# run_query, query_categories and helper functions rather than copies of them.
+
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(APP_DIR, "bench_results.json")
+DEFAULT_BASELINE = os.path.join(APP_DIR, "bench_baseline.json")
+
+RESULT_SIZES = [100, 10_000, 100_000]
+RESULT_QUERY = """
+    SELECT g AS id, md5(g::TEXT) AS label, g * 0.5 AS amount, now() AS created_at
+    FROM generate_series(1, %s) g;
+"""
+DATA_SCALES = [1, 10, 100]
+CHART_SIZES = [100, 10_000]
+
+# Transaction tables grown to reach each data scale; the date column is shifted so keys stay unique
+SCALED_TABLES = {
+    "borrows": ("date_out", "username, bookid, date_out - k * 7, due_date - k * 7, penalty, 'Returned'"),
+    "buys_books": ("date_time", "username, branchid, isbn, quantity, date_time - k * INTERVAL '7 days'"),
+    "purchases_items": ("date_time", "username, branchid, barcode, quantity, date_time - k * INTERVAL '7 days'"),
+}
+
+def load_app():
+    """
+    Imports app.py without `streamlit run`; widgets return their defaults and nothing is rendered.
+    """
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    os.chdir(APP_DIR)
+    spec = importlib.util.spec_from_file_location("libtech_app", os.path.join(APP_DIR, "app.py"))
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    if app.conn is None:
+        sys.exit("Could not connect to the database; check the DB_* environment variables.")
+    return app
+
+class Bench:
+    """
+    Collects timings as {name: {"min", "median", "mean", "stdev", "rounds"}} in seconds.
+    """
+    def __init__(self, rounds):
+        self.rounds = rounds
+        self.results = {}
+
+    def measure(self, name, fn, rounds=None, warmup=1):
+        for _ in range(warmup):
+            fn()
+        timings = []
+        for _ in range(rounds or self.rounds):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        self.results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.fmean(timings),
+            "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "rounds": len(timings),
+        }
+        print(f"{name:<90} median {self.results[name]['median'] * 1000:10.3f} ms")
+
+    def record(self, name, value, unit):
+        """
+        Stores a single measurement that is not a time (e.g. peak memory), compared like the timings.
+        """
+        self.results[name] = {"min": value, "median": value, "mean": value, "stdev": 0.0, "rounds": 1, "unit": unit}
+        print(f"{name:<90}        {value:10.3f} {unit}")
+
+def rollback_after(app, statement, params):
+    """
+    Runs a write (including its triggers) and rolls it back, so every round sees the same data.
+    """
+    def run():
+        with app.conn.cursor() as cur:
+            cur.execute(statement, params)
+        app.conn.rollback()
+    return run
+
+def bench_run_query(app, bench):
+    for size in RESULT_SIZES:
+        bench.measure(f"run_query[{size} rows]", lambda: app.run_query(RESULT_QUERY, (size,)))
+
+def scale_data(app, current_scale, target_scale):
+    """
+    Grows the transaction tables from current_scale to target_scale times their original size by copying the
+    original rows (kept in bench_base_<table>) shifted k weeks into the past for k = current_scale..target_scale-1.
+    """
+    with app.conn.cursor() as cur:
+        # app.conn carries the circulation timeout; bulk loads run as the batch class like the app's jobs
+        cur.execute("SELECT set_config('statement_timeout', %s, true);", (app.STATEMENT_TIMEOUTS["batch"],))
+        for table, (date_col, columns) in SCALED_TABLES.items():
+            cur.execute(f"CREATE TABLE IF NOT EXISTS bench_base_{table} AS SELECT * FROM {table};")
+            # The copies are history: skip the per-row business and rollup triggers while loading them
+            cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER;")
+            cur.execute(f"""
+                INSERT INTO {table}
+                SELECT {columns}
+                FROM bench_base_{table}
+                CROSS JOIN generate_series(%s, %s) k
+                ON CONFLICT DO NOTHING;
+            """, (current_scale, target_scale - 1))
+            cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER;")
+            cur.execute(f"ANALYZE {table};")
+    app.conn.commit()
+
+def restore_data(app):
+    """
+    Puts the transaction tables back to their original rows from bench_base_<table> and drops the copies,
+    so the database (and the next run's 1x measurements) are left as they were before scale_data.
+    """
+    with app.conn.cursor() as cur:
+        cur.execute("SELECT set_config('statement_timeout', %s, true);", (app.STATEMENT_TIMEOUTS["batch"],))
+        for table in SCALED_TABLES:
+            cur.execute("SELECT to_regclass(%s);", (f"bench_base_{table}",))
+            if cur.fetchone()[0] is None:
+                continue
+            cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER;")
+            cur.execute(f"TRUNCATE {table};")
+            cur.execute(f"INSERT INTO {table} SELECT * FROM bench_base_{table};")
+            cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER;")
+            cur.execute(f"DROP TABLE bench_base_{table};")
+            cur.execute(f"ANALYZE {table};")
+    app.conn.commit()
+
+def bench_catalogued_queries(app, bench):
+    # A run that was interrupted while scaled up left its copies behind
+    restore_data(app)
+    try:
+        run_catalogued_queries(app, bench)
+    finally:
+        app.conn.rollback()
+        restore_data(app)
+
+NO_SAMPLE_ROWS = "the database has no sample rows to use (load insert_data.sql)"
+
+def sample_row(cur, query, params=None):
+    """
+    Returns the first row of a sample lookup, or None when the database has none (e.g. no insert_data.sql).
+    """
+    cur.execute(query, params)
+    return cur.fetchone()
+
+def sample_params(app):
+    """
+    Picks one existing value for every parameter label used by the parameterised reports (the same labels
+    as the report forms), so those reports are timed on realistic inputs. Returns None without sample rows.
+    """
+    with app.conn.cursor() as cur:
+        stocked = sample_row(cur, """
+            SELECT bs.title, s.branchid, s.isbn
+            FROM stores_booksforsale s
+            JOIN books_for_sale bs ON bs.isbn = s.isbn
+            WHERE s.number_of_copies > 0
+            ORDER BY s.number_of_copies DESC
+            LIMIT 1;
+        """)
+        other = stocked and sample_row(cur, "SELECT branchid FROM libraryy WHERE branchid <> %s LIMIT 1;", (stocked[1],))
+        borrowed = sample_row(cur, "SELECT bookid FROM borrows GROUP BY bookid ORDER BY COUNT(*) DESC LIMIT 1;")
+    app.conn.rollback()
+    if not (stocked and other and borrowed):
+        return None
+    (title, branch_id, isbn), (other_branch,), (book_id,) = stocked, other, borrowed
+    return {
+        "Book Title": title,
+        "Branch ID": branch_id,
+        "From Branch ID": branch_id,
+        "To Branch ID": other_branch,
+        "Book ISBN": isbn,
+        "Transfer Quantity": 1,
+        "Book ID (Format: ISBN#ID)": book_id,
+    }
+
+def query_error(app, query, params=None):
+    """
+    Runs a report query once and returns the error it raises, if any (run_query only shows errors).
+    """
+    try:
+        app.fetch_dataframe(app.conn, query, params)
+        return None
+    except Exception as e:
+        return e
+    finally:
+        app.conn.rollback()
+
+def run_catalogued_queries(app, bench):
+    samples = sample_params(app)
+    if samples is None:
+        print(f"Skipping the parameterised reports: {NO_SAMPLE_ROWS}")
+    skipped = set()
+
+    current_scale = 1
+    for scale in DATA_SCALES:
+        if scale > current_scale:
+            scale_data(app, current_scale, scale)
+            current_scale = scale
+        for queries in app.query_categories.values():
+            for name, details in queries.items():
+                if name in skipped or (details.get("requires_params") and samples is None):
+                    continue
+                is_call = not details.get("computed") and details["query"].strip().upper().startswith("CALL")
+                params = tuple(samples[label] for label in details["params"]) if details.get("requires_params") else None
+                if scale == 1 and not details.get("computed") and not is_call:
+                    error = query_error(app, details["query"], params)
+                    if error is not None:
+                        # e.g. the overdue report without Fines.sql
+                        print(f"Skipping report {name!r}: {str(error).strip()}")
+                        skipped.add(name)
+                        continue
+                if details.get("requires_params"):
+                    if is_call:
+                        # Procedures write: time them like the Add Data inserts, rolled back each round
+                        fn = rollback_after(app, details["query"], params)
+                    else:
+                        fn = lambda q=details["query"], p=params: app.run_query(q, p, replica_ok=True)
+                elif name == "Categorize Customers into Segments":
+                    fn = lambda: app.score_customers(app.CustomerActivityCache.fetch())
+                elif name == "Rental Demand Forecast & Copies to Move from Sale":
+                    fn = lambda: app.forecast_rental_demand(
+                        app.run_query(app.RENTAL_LOANS_SQL, (app.FORECAST_MONTHS,), replica_ok=True),
+                        app.run_query(app.RENTAL_STOCK_SQL, replica_ok=True)
+                    )
+                else:
+                    # Same path as the report pages: analytics pool, timeout and concurrency cap
+                    fn = lambda q=details["query"]: app.run_query(q, replica_ok=True)
+                bench.measure(f"query[{scale}x] {name}", fn, rounds=max(1, bench.rounds // scale))
+
+def bench_writes(app, bench):
+    with app.conn.cursor() as cur:
+        stocked = sample_row(cur, """
+            SELECT s.branchid, s.isbn
+            FROM stores_booksforsale s
+            WHERE s.number_of_copies > 0
+            ORDER BY s.number_of_copies DESC
+            LIMIT 1;
+        """)
+        customer = sample_row(cur, """
+            SELECT c.username
+            FROM customer c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM borrows b
+                WHERE b.username = c.username AND b.status = 'Borrowed' AND b.due_date < CURRENT_DATE
+            )
+            LIMIT 1;
+        """)
+        book = sample_row(cur, "SELECT bookid FROM books_for_rent LIMIT 1;")
+        other = stocked and sample_row(cur, "SELECT branchid FROM libraryy WHERE branchid <> %s LIMIT 1;", (stocked[0],))
+    app.conn.rollback()
+    if not (stocked and customer and book and other):
+        print(f"Skipping write benchmarks: {NO_SAMPLE_ROWS}")
+        return
+    (branch_id, isbn), (username,), (book_id,), (other_branch,) = stocked, customer, book, other
+
+    # Same statements as the Add Data forms; each round's trigger work is rolled back
+    bench.measure("insert buys_books (trigger update_book_stock)", rollback_after(app, """
+        INSERT INTO buys_books (username, branchid, isbn, quantity, date_time)
+        VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (username, branchid, isbn, date_time)
+        DO NOTHING;
+    """, (username, branch_id, isbn, 1)))
+    bench.measure("insert borrows (trigger prevent_borrow_with_overdue)", rollback_after(app, """
+        INSERT INTO borrows (username, bookid, date_out, due_date, penalty, status)
+        VALUES (%s, %s, CURRENT_DATE + 3650, CURRENT_DATE + 3664, %s, %s)
+        ON CONFLICT (username, bookid, date_out)
+        DO NOTHING;
+    """, (username, book_id, 0, "Borrowed")))
+    bench.measure("insert sale_to_rent (trigger handle_sale_to_rent)", rollback_after(app, """
+        INSERT INTO sale_to_rent (bookid, isbn, date_moved, discount)
+        VALUES (%s, %s, CURRENT_DATE, %s)
+        ON CONFLICT (bookid, isbn)
+        DO NOTHING;
+    """, (f"{isbn}#991", isbn, 10)))
+    bench.measure("call transfer_book_stock", rollback_after(app, """
+        CALL transfer_book_stock(%s, %s, %s, %s);
+    """, (branch_id, other_branch, isbn, 1)))
+
+def bench_row_level_security(app, bench):
+    """
+    Compares a customer's loans read unrestricted on the app connection with the same rows read through a
+    pooled tenant connection (SET LOCAL ROLE + app.current_user, filtered by the RLS policies).
+    """
+    with app.conn.cursor() as cur:
+        borrower = sample_row(cur, "SELECT username FROM borrows GROUP BY username ORDER BY COUNT(*) DESC LIMIT 1;")
+    app.conn.rollback()
+    if borrower is None:
+        print(f"Skipping row-level security benchmarks: {NO_SAMPLE_ROWS}")
+        return
+    username = borrower[0]
+    identity = {"email": "bench@libtech", "role": "Customer", "username": username}
+
+    def tenant(query, params=None):
+        def run():
+            with app.tenant_cursor(identity) as cur:
+                cur.execute(query, params)
+                cur.fetchall()
+        return run
+
+    try:
+        tenant("SELECT 1;")()
+    except Exception as e:
+        print(f"Skipping row-level security benchmarks (apply Security Mechanism 6 of BONUSES.sql): {e}")
+        return
+    bench.measure("rls: unrestricted customer loans", lambda: app.run_query(
+        "SELECT * FROM borrows WHERE username = %s;", (username,)))
+    bench.measure("rls: tenant customer loans (policy only)", tenant("SELECT * FROM borrows;"))
+    bench.measure("rls: tenant customer loans (policy + filter)", tenant(
+        "SELECT * FROM borrows WHERE username = %s;", (username,)))
+    bench.measure("rls: tenant checkout + reset only", tenant("SELECT 1;"))
+
+def bench_charts(app, bench):
+    import numpy as np
+    import pandas as pd
+    for size in CHART_SIZES:
+        df = pd.DataFrame({
+            "label": [f"item {i}" for i in range(size)],
+            "value": np.random.default_rng(0).random(size) * 100,
+        })
+        def build():
+            fig = app.px.bar(
+                df,
+                x='label',
+                y='value',
+                title="Benchmark",
+                color='value',
+                color_continuous_scale='Viridis'
+            )
+            fig.update_layout(showlegend=False)
+            fig.to_json()
+        bench.measure(f"plotly bar + serialize[{size} rows]", build)
+
+def bench_shared_cache(app, bench):
+    """
+    Compares fetching a result from the database with reading it back from the shared Arrow cache.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        cache = app.SharedResultCache(directory)
+        for size in RESULT_SIZES:
+            key = f"bench {size}"
+            table = app.run_analytics_table(RESULT_QUERY, (size,))
+            bench.measure(f"shared cache put[{size} rows]", lambda: cache.put(key, table))
+            bench.measure(f"shared cache get[{size} rows]", lambda: cache.get(key))
+
+def worker_counts(max_workers):
+    counts = [1]
+    while counts[-1] * 2 <= max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+def bench_worker_scaling(app, bench, max_workers):
+    """
+    Throughput of the offloaded post-processing (the rental demand forecast) run in-process and in spawned
+    pools of 1..max_workers processes. Each round runs the same batch of jobs, so the median shrinks as the
+    pool scales; jobs/s is printed for comparison.
+    """
+    loans = app.run_query(app.RENTAL_LOANS_SQL, (app.FORECAST_MONTHS,), replica_ok=True)
+    stock = app.run_query(app.RENTAL_STOCK_SQL, replica_ok=True)
+    if stock.empty or loans.empty:
+        print("Skipping worker scaling benchmarks: no rental loans or stock.")
+        return
+    jobs = max_workers * 4
+    rounds = max(1, bench.rounds // 4)
+
+    name = f"forecast x{jobs} [in-process]"
+    bench.measure(name, lambda: [app.forecast_rental_demand(loans, stock) for _ in range(jobs)], rounds=rounds)
+    print(f"{'':<90} {jobs / bench.results[name]['median']:10.1f} jobs/s")
+    for count in worker_counts(max_workers):
+        with ProcessPoolExecutor(max_workers=count, mp_context=multiprocessing.get_context("spawn")) as pool:
+            name = f"forecast x{jobs} [{count} worker processes]"
+            bench.measure(name, lambda: list(pool.map(app.forecast_rental_demand, [loans] * jobs, [stock] * jobs)), rounds=rounds)
+            print(f"{'':<90} {jobs / bench.results[name]['median']:10.1f} jobs/s")
+
+def arrow_bytes(table):
+    """
+    Serializes a table the way st.dataframe sends it to the browser (an Arrow IPC stream).
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def render_path(app, path, size):
+    """
+    One report from query to display bytes: "rows" is the RealDictCursor -> DataFrame -> Arrow path that
+    st.dataframe(df) takes, "arrow" the COPY -> Arrow table path of run_analytics_table.
+    """
+    with app.analytics_connection() as read_conn:
+        if path == "rows":
+            table = pa.Table.from_pandas(app.fetch_dataframe(read_conn, RESULT_QUERY, (size,)))
+        else:
+            table = app.fetch_table(read_conn, RESULT_QUERY, (size,))
+    return arrow_bytes(table)
+
+def peak_memory_mb(path, size):
+    """
+    Runs in a fresh process: returns how much one render_path call raises the peak RSS, in MB.
+    """
+    app = load_app()
+    render_path(app, path, 10)
+    unit = 1 if sys.platform == "darwin" else 1024   # ru_maxrss is in bytes on macOS, KiB on Linux
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    render_path(app, path, size)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    return (after - before) / (1 << 20)
+
+def bench_arrow_pipeline(app, bench):
+    """
+    Time to first render and peak memory of the Arrow result path against the row-by-row one.
+    Memory is measured in a new process per run, since the peak RSS of this one only ever grows.
+    """
+    for size in RESULT_SIZES:
+        for path in ("rows", "arrow"):
+            bench.measure(f"first render[{path}, {size} rows]", lambda: render_path(app, path, size))
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                bench.record(f"peak memory[{path}, {size} rows]", pool.submit(peak_memory_mb, path, size).result(), "MB")
+
+def compare(results, baseline, max_regression):
+    """
+    Returns the benchmarks whose median is more than max_regression slower than the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["median"] / base["median"] if base["median"] > 0 else 1.0
+        if ratio > 1 + max_regression:
+            regressions.append((name, base["median"], result["median"], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app.py's data layer against a disposable database.")
+    parser.add_argument("--rounds", type=int, default=20, help="timed rounds per benchmark (divided by the data scale for queries)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write this run's results as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed slowdown of the median, e.g. 0.25 = 25%%")
+    parser.add_argument("--skip-scaling", action="store_true", help="only run catalogued queries at the current data size")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="largest process pool in the worker scaling benchmark")
+    args = parser.parse_args()
+
+    if args.skip_scaling:
+        DATA_SCALES[:] = [1]
+
+    app = load_app()
+    bench = Bench(args.rounds)
+    bench_run_query(app, bench)
+    bench_writes(app, bench)
+    bench_row_level_security(app, bench)
+    bench_charts(app, bench)
+    bench_arrow_pipeline(app, bench)
+    bench_shared_cache(app, bench)
+    bench_worker_scaling(app, bench, args.max_workers)
+    bench_catalogued_queries(app, bench)
+
+    with open(args.output, "w") as f:
+        json.dump(bench.results, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(bench.results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --save-baseline first.")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(bench.results, baseline, args.max_regression)
+    if regressions:
+        print("\nPERFORMANCE REGRESSIONS:")
+        for name, before, after, ratio in regressions:
+            unit = bench.results[name].get("unit")
+            if unit:
+                print(f"  {name}: {before:.3f} {unit} -> {after:.3f} {unit} ({ratio:.2f}x)")
+            else:
+                print(f"  {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({ratio:.2f}x)")
+        sys.exit(1)
+    print("No regressions beyond the allowed threshold.")
+
+if __name__ == "__main__":
+    main()
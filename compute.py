@@ -0,0 +1,153 @@
+# compute.py
+#
+# CPU-bound post-processing used by app.py's reports: RFM scoring, the book neighbour model and the
+# rental demand forecast. They take and return plain DataFrames and never touch Streamlit or the
+# database, so app.py can run them in-process or hand them to its process pool (see offload() in app.py),
+# where they run outside the web process's GIL.
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+RECOMMENDATION_NEIGHBOURS = 20     # neighbours kept per ISBN in book_neighbours
+FORECAST_HISTORY_DAYS = 365        # window for utilization and saturation statistics
+FORECAST_MONTHS = 24               # monthly loan history used by the seasonal forecast
+TARGET_UTILIZATION = 0.75          # share of copy-days we want on loan; more than this means waiting patrons
+
+
+def quintile_scores(values):
+    """
+    Scores values 1 (lowest fifth) to 5 (highest fifth) by percentile rank; missing values score 0.
+    """
+    ranks = values.rank(method="average", pct=True)
+    return np.ceil(ranks * 5).fillna(0).astype(np.int8)
+
+def score_customers(activity, today=None):
+    """
+    Computes recency/frequency/monetary quintile scores and an RFM segment for every customer.
+    """
+    today = today or pd.Timestamp.today().normalize()
+    df = activity[["username", "last_purchase", "orders", "spending"]].copy()
+    df["recency_days"] = (today - df["last_purchase"]).dt.days
+    buyers = df["orders"] > 0
+    df["r_score"] = quintile_scores(-df["recency_days"].where(buyers))
+    df["f_score"] = quintile_scores(df["orders"].where(buyers))
+    df["m_score"] = quintile_scores(df["spending"].where(buyers))
+    r, f, m = df["r_score"], df["f_score"], df["m_score"]
+    df["customer_segment"] = np.select(
+        [
+            ~buyers,
+            (r >= 4) & (f >= 4) & (m >= 4),
+            (f >= 4),
+            (m >= 4),
+            (r >= 4) & (f <= 2),
+            (r <= 2) & (f >= 3),
+        ],
+        ["No Purchases", "Champions", "Loyal Customers", "Big Spenders", "New Customers", "At Risk"],
+        default="Hibernating",
+    )
+    return df
+
+def build_book_neighbours(interactions, k=RECOMMENDATION_NEIGHBOURS):
+    """
+    Computes the top-k cosine neighbours of every ISBN from a (username, isbn) interaction frame,
+    using the sparse ISBN x ISBN co-occurrence matrix. Returns (isbn, neighbour_isbn, score, rank) rows.
+    """
+    users, user_labels = pd.factorize(interactions["username"])
+    isbns, isbn_labels = pd.factorize(interactions["isbn"])
+    x = sparse.csr_matrix(
+        (np.ones(len(users), dtype=np.float32), (users, isbns)),
+        shape=(len(user_labels), len(isbn_labels))
+    )
+    x.data[:] = 1  # count each customer once per ISBN
+
+    co = (x.T @ x).tocsr()
+    counts = co.diagonal()
+    co.setdiag(0)
+    co.eliminate_zeros()
+
+    # Cosine similarity: co-occurrences / sqrt(customers of i * customers of j)
+    rows = np.repeat(np.arange(co.shape[0]), np.diff(co.indptr))
+    scores = co.data / np.sqrt(counts[rows] * counts[co.indices])
+
+    # Rank neighbours within each row by descending score and keep the first k
+    order = np.lexsort((-scores, rows))
+    ranks = np.arange(len(order)) - co.indptr[rows[order]]
+    keep = order[ranks < k]
+    return pd.DataFrame({
+        "isbn": isbn_labels[rows[keep]],
+        "neighbour_isbn": isbn_labels[co.indices[keep]],
+        "score": scores[keep].astype(np.float64),
+        "rank": ranks[ranks < k] + 1,
+    })
+
+def forecast_rental_demand(loans, stock, today=None):
+    """
+    Computes utilization, a waiting proxy and a seasonal next-month forecast for every rented ISBN,
+    and how many copies to move from sale to rent. All titles are processed as one set of arrays.
+    """
+    today = (today or pd.Timestamp.today()).normalize()
+    stock = stock.reset_index(drop=True)
+    n = len(stock)
+    copies = stock["copies"].to_numpy(dtype=np.float64)
+    isbn_pos = pd.Index(stock["isbn"]).get_indexer(loans["isbn"])
+    loans = loans[isbn_pos >= 0]
+    isbn_pos = isbn_pos[isbn_pos >= 0]
+
+    date_out = pd.to_datetime(loans["date_out"]).to_numpy()
+    due_date = pd.to_datetime(loans["due_date"]).to_numpy()
+    open_loan = (loans["status"] != "Returned").to_numpy()
+    # Returned loans are assumed to last until the due date; open loans at least until today
+    end = np.where(open_loan, np.maximum(due_date, today.to_datetime64()), due_date)
+    loan_days = np.maximum((end - date_out) / np.timedelta64(1, "D"), 1)
+
+    # Copies on loan per ISBN per day over the window, from +1/-1 boundaries and a cumulative sum
+    window_start = today - pd.Timedelta(days=FORECAST_HISTORY_DAYS)
+    start_idx = np.clip((date_out - window_start.to_datetime64()) // np.timedelta64(1, "D"), 0, FORECAST_HISTORY_DAYS)
+    end_idx = np.clip((end - window_start.to_datetime64()) // np.timedelta64(1, "D"), 0, FORECAST_HISTORY_DAYS)
+    boundaries = np.zeros((n, FORECAST_HISTORY_DAYS + 1), dtype=np.int32)
+    np.add.at(boundaries, (isbn_pos, start_idx.astype(np.int64)), 1)
+    np.add.at(boundaries, (isbn_pos, end_idx.astype(np.int64)), -1)
+    on_loan = np.cumsum(boundaries, axis=1)[:, :FORECAST_HISTORY_DAYS]
+    utilization = np.minimum(on_loan, copies[:, None]).sum(axis=1) / (copies * FORECAST_HISTORY_DAYS)
+    saturated_days = (on_loan >= copies[:, None]).sum(axis=1)
+
+    # Monthly loan counts, oldest month first; the last column is the current (partial) month
+    month_idx = (
+        (today.year - pd.DatetimeIndex(date_out).year) * 12 + (today.month - pd.DatetimeIndex(date_out).month)
+    ).to_numpy()
+    in_range = (month_idx >= 0) & (month_idx < FORECAST_MONTHS)   # loans dated in a future month are not history
+    monthly = np.zeros((n, FORECAST_MONTHS), dtype=np.float64)
+    np.add.at(monthly, (isbn_pos[in_range], FORECAST_MONTHS - 1 - month_idx[in_range]), 1)
+    complete = monthly[:, :-1]
+
+    # Seasonal naive forecast for next month: same month last year scaled by the recent year-over-year trend,
+    # falling back to the mean of the last three complete months when there is no history a year back
+    recent = complete[:, -3:].sum(axis=1)
+    year_before = complete[:, -15:-12].sum(axis=1)
+    same_month_last_year = complete[:, -11]
+    has_season = year_before > 0
+    trend = np.where(has_season, (recent + 1) / (year_before + 1), 1.0)
+    forecast = np.where(has_season, same_month_last_year * trend, recent / 3)
+
+    loans_per_isbn = np.bincount(isbn_pos, minlength=n)
+    avg_loan_days = np.divide(
+        np.bincount(isbn_pos, weights=loan_days, minlength=n), loans_per_isbn,
+        out=np.full(n, loan_days.mean() if len(loan_days) else 14.0), where=loans_per_isbn > 0
+    )
+    recommended = np.ceil(forecast * avg_loan_days / (30 * TARGET_UTILIZATION))
+    to_move = np.clip(recommended - copies, 0, stock["sale_copies"].to_numpy(dtype=np.float64))
+
+    result = pd.DataFrame({
+        "isbn": stock["isbn"],
+        "title": stock["title"],
+        "copies": copies.astype(np.int64),
+        "loans_last_year": (monthly[:, -12:]).sum(axis=1).astype(np.int64),
+        "utilization": utilization.round(3),
+        "saturated_days": saturated_days,
+        "forecast_next_month": forecast.round(1),
+        "recommended_copies": np.maximum(recommended, copies).astype(np.int64),
+        "copies_to_move": to_move.astype(np.int64),
+        "sale_copies_available": stock["sale_copies"].astype(np.int64),
+    })
+    return result.sort_values(["copies_to_move", "utilization"], ascending=False, ignore_index=True)
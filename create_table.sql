@@ -1,3 +1,5 @@
+--Passcode is encrypted and Passcode_Hash added by the security mechanisms in BONUSES.sql; the app's login
+--and its Add Data form for this table need them, so run that part of BONUSES.sql after this script
 CREATE TABLE Authentication_System ( 
 	Email VARCHAR(50), 
 	Passcode VARCHAR(20) NOT NULL, 
@@ -214,6 +216,8 @@ create table Purchases_Items (
  
     CONSTRAINT fk_Purchases_Items_Barcode FOREIGN KEY (Barcode) REFERENCES Items(Barcode) 
 ); 
+--Fines.sql must be run after this script: it adds Fine_Accrued_Through and fine_daily_rate(),
+--which the app's "Customers with Unreturned Books Past Due Date" report uses
 create table Borrows ( 
     Username VARCHAR(20) NOT NULL,   
     BookID VARCHAR(17) NOT NULL,   
@@ -0,0 +1,110 @@
+# serve.py
+#
+# Runs app.py as several Streamlit processes on one host, for use behind a load balancer with sticky
+# sessions. One Streamlit process runs every session's script in a single Python interpreter, so report
+# building is limited to about one core by the GIL; N processes use N cores.
+#
+# The processes share report results through an on-disk Arrow cache (LIBTECH_SHARED_CACHE_DIR) and can each
+# hand CPU-bound post-processing to a process pool (LIBTECH_CPU_WORKERS); see "Multi-Process Serving" in app.py.
+#
+#   python serve.py --workers 4 --nginx-conf libtech.conf   (app processes on ports 8501-8504 + nginx site config)
+#
+# A Streamlit session lives in the process that opened its websocket, so the load balancer must keep each
+# browser on one process (the generated nginx config uses ip_hash). Logins and the Add Data staging area
+# are per process as well.
+
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY_SECONDS = 2
+
+NGINX_TEMPLATE = """\
+# Generated by serve.py: {workers} LibTech app processes behind one address
+upstream libtech_app {{
+    ip_hash;   # sticky: a browser's websocket and its reconnects reach the same process
+{servers}
+}}
+
+server {{
+    listen {listen};
+
+    location / {{
+        proxy_pass http://libtech_app;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+        proxy_set_header Host $host;
+        proxy_read_timeout 86400;
+    }}
+}}
+"""
+
+def nginx_config(ports, listen):
+    servers = "\n".join(f"    server 127.0.0.1:{port};" for port in ports)
+    return NGINX_TEMPLATE.format(workers=len(ports), servers=servers, listen=listen)
+
+def start_worker(port, env):
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", os.path.join(APP_DIR, "app.py"),
+            "--server.port", str(port),
+            "--server.address", "127.0.0.1",
+            "--server.headless", "true",
+        ],
+        cwd=APP_DIR,
+        env=env,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Run app.py as several Streamlit processes sharing one cache.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="app processes to run (default: one per core)")
+    parser.add_argument("--base-port", type=int, default=8501, help="port of the first process; the others follow")
+    parser.add_argument("--cache-dir", default=os.path.join(APP_DIR, "shared_cache"), help="shared Arrow result cache")
+    parser.add_argument("--cpu-workers", type=int, default=0, help="post-processing pool size per app process (0: none)")
+    parser.add_argument("--nginx-conf", help="write an nginx site config for the processes to this file")
+    parser.add_argument("--listen", default="8080", help="address nginx listens on in the generated config")
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    if args.nginx_conf:
+        with open(args.nginx_conf, "w") as f:
+            f.write(nginx_config(ports, args.listen))
+        print(f"nginx config written to {args.nginx_conf}")
+
+    env = dict(os.environ)
+    env["LIBTECH_SHARED_CACHE_DIR"] = args.cache_dir
+    env["LIBTECH_CPU_WORKERS"] = str(args.cpu_workers)
+    # The same cookie secret everywhere, so a session cookie signed by one process is accepted by the others
+    env.setdefault("STREAMLIT_SERVER_COOKIE_SECRET", secrets.token_hex(32))
+
+    workers = {port: start_worker(port, env) for port in ports}
+    print(f"Serving app.py on ports {ports[0]}-{ports[-1]} (shared cache: {args.cache_dir})")
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for port, process in workers.items():
+            if process.poll() is not None and not stopping:
+                print(f"Process on port {port} exited with {process.returncode}; restarting")
+                time.sleep(RESTART_DELAY_SECONDS)
+                workers[port] = start_worker(port, env)
+
+    for process in workers.values():
+        process.terminate()
+    for process in workers.values():
+        process.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import json
+import sys
+
+import pytest
+
+import benchmark
+
+BENCHES = [
+    "bench_run_query", "bench_writes", "bench_row_level_security", "bench_charts",
+    "bench_arrow_pipeline", "bench_shared_cache", "bench_catalogued_queries",
+]
+
+def test_main_reports_regressions_against_the_baseline(tmp_path, monkeypatch, capsys):
+    def slow_benches(app, bench, *args):
+        bench.results["query"] = {"min": 0.2, "median": 0.2, "mean": 0.2, "stdev": 0.0, "rounds": 1}
+        bench.record("peak memory", 300.0, "MB")
+
+    monkeypatch.setattr(benchmark, "load_app", lambda: None)
+    for name in BENCHES:
+        monkeypatch.setattr(benchmark, name, lambda app, bench: None)
+    monkeypatch.setattr(benchmark, "bench_worker_scaling", slow_benches)
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({
+        "query": {"min": 0.1, "median": 0.1, "mean": 0.1, "stdev": 0.0, "rounds": 1},
+        "peak memory": {"min": 100.0, "median": 100.0, "mean": 100.0, "stdev": 0.0, "rounds": 1, "unit": "MB"},
+    }))
+    monkeypatch.setattr(sys, "argv", [
+        "benchmark.py", "--baseline", str(baseline), "--output", str(tmp_path / "results.json"),
+    ])
+
+    with pytest.raises(SystemExit) as exit_info:
+        benchmark.main()
+
+    assert exit_info.value.code == 1
+    out = capsys.readouterr().out
+    assert "query: 100.000 ms -> 200.000 ms (2.00x)" in out
+    assert "peak memory: 100.000 MB -> 300.000 MB (3.00x)" in out
@@ -0,0 +1,18 @@
+import pandas as pd
+
+from compute import forecast_rental_demand
+
+def test_forecast_ignores_loans_dated_in_a_future_month():
+    today = pd.Timestamp("2026-10-19")
+    stock = pd.DataFrame({"isbn": ["111"], "title": ["A Book"], "copies": [2], "sale_copies": [1]})
+    loans = pd.DataFrame({
+        "isbn": ["111", "111"],
+        "date_out": [pd.Timestamp("2026-10-01"), pd.Timestamp("2026-12-05")],
+        "due_date": [pd.Timestamp("2026-10-15"), pd.Timestamp("2026-12-19")],
+        "status": ["Returned", "Borrowed"],
+    })
+
+    result = forecast_rental_demand(loans, stock, today=today)
+
+    assert len(result) == 1
+    assert result.loc[0, "loans_last_year"] == 1
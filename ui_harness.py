@@ -0,0 +1,262 @@
+# ui_harness.py
+#
+# Headless runner for app.py's pages, built on Streamlit's AppTest: scripts the same clicks a user makes
+# (pick a category, pick a query, fill in a form, submit), times each rerun end to end and counts the
+# SQL statements the app sends during it. No browser or `streamlit run` server is needed.
+#
+# Point the app at a local seeded database (create_table.sql plus the .sql objects the pages use):
+#   DB_HOST=127.0.0.1 DB_NAME=libtech_test DB_USER=postgres DB_PASSWORD=... python ui_harness.py
+#
+# Flows that need a staff login (Add Data) read the credentials from HARNESS_EMAIL / HARNESS_PASSCODE.
+# More flows can be given as JSON with --flows, in the same shape as DEFAULT_FLOWS.
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from functools import partial
+
+import psycopg2
+import psycopg2.extensions
+from streamlit.testing.v1 import AppTest
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_TIMEOUT_SECONDS = 120
+CHANGE_FEED_THREAD = "libtech-change-feed"   # its background polling is not part of any rerun
+
+# Each step is [action, widget label, value]:
+#   "select": choose an option in a selectbox or radio     "input": type into a text or number input
+#   "click":  press a button or form submit button          "login": sign in with the HARNESS_* credentials
+DEFAULT_FLOWS = {
+    "top_borrowed_books": [
+        ["select", "Select a Category", "Book Rentals & Branch Performance"],
+        ["select", "Select a Query", "Top 5 Borrowed Books in the Last Year"],
+        ["click", "Run Query"],
+    ],
+    "rental_demand_forecast": [
+        ["select", "Select a Category", "Book Rentals & Branch Performance"],
+        ["select", "Select a Query", "Rental Demand Forecast & Copies to Move from Sale"],
+        ["click", "Run Query"],
+    ],
+    "customer_segments": [
+        ["select", "Select a Category", "Customer Insights"],
+        ["select", "Select a Query", "Categorize Customers into Segments"],
+        ["click", "Run Query"],
+    ],
+    "inventory_value": [
+        ["select", "Select a Category", "Staff & Inventory Management"],
+        ["select", "Select a Query", "Calculate Total Inventory Value"],
+        ["select", "Branch ID", "LIBTECH01"],
+        ["click", "Execute"],
+    ],
+    "time_series": [
+        ["select", "Select a Category", "Time-Series Analytics"],
+    ],
+    "recommendations": [
+        ["select", "Select a Category", "Recommendations"],
+    ],
+    "add_data_page": [
+        ["login"],
+        ["select", "Select a Category", "Add Data"],
+    ],
+}
+
+class StatementCounter:
+    """
+    Counts statements executed by the app, per thread, so each rerun can be attributed its own SQL.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.statements = []
+
+    def record(self, query):
+        if threading.current_thread().name == CHANGE_FEED_THREAD:
+            return
+        with self.lock:
+            self.count += 1
+            self.statements.append(query if isinstance(query, str) else str(query))
+
+    def reset(self):
+        with self.lock:
+            count, statements = self.count, self.statements
+            self.count, self.statements = 0, []
+        return count, statements
+
+COUNTER = StatementCounter()
+
+class CountingCursor:
+    """
+    Wraps a psycopg2 cursor (of any cursor_factory) and reports every statement it sends to COUNTER.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, vars=None):
+        COUNTER.record(query)
+        return self._cursor.execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        COUNTER.record(query)
+        return self._cursor.executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        COUNTER.record(sql)   # report results are read with COPY (see fetch_table in app.py)
+        return self._cursor.copy_expert(sql, file, size)
+
+    def callproc(self, procname, parameters=None):
+        COUNTER.record(f"SELECT * FROM {procname}(...)")   # what psycopg2 sends for callproc
+        return self._cursor.callproc(procname, parameters)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+class CountingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(super().cursor(*args, **kwargs))
+
+def install_statement_counter():
+    """
+    Makes every psycopg2.connect() in this process (app.py's included) return a CountingConnection.
+    """
+    psycopg2.connect = partial(psycopg2.connect, connection_factory=CountingConnection)
+
+def find_widget(at, label):
+    """
+    Returns the first widget with the given label in the main area or the sidebar.
+    """
+    for kind in ("selectbox", "radio", "text_input", "number_input", "text_area", "date_input", "button"):
+        for widget in at.get(kind):
+            if getattr(widget, "label", None) == label:
+                return widget
+    raise LookupError(f"No widget labelled {label!r} on the current page")
+
+def apply_step(at, step):
+    action = step[0]
+    if action == "login":
+        email, passcode = os.environ.get("HARNESS_EMAIL"), os.environ.get("HARNESS_PASSCODE")
+        if not email or not passcode:
+            raise LookupError("The flow needs HARNESS_EMAIL and HARNESS_PASSCODE")
+        find_widget(at, "Email").input(email)
+        find_widget(at, "Passcode").input(passcode)
+        find_widget(at, "Log In").click()
+    elif action == "select":
+        find_widget(at, step[1]).set_value(step[2])
+    elif action == "input":
+        find_widget(at, step[1]).set_value(step[2])
+    elif action == "click":
+        find_widget(at, step[1]).click()
+    else:
+        raise ValueError(f"Unknown step action {action!r}")
+
+def timed_run(at):
+    COUNTER.reset()
+    start = time.perf_counter()
+    at.run(timeout=APP_TIMEOUT_SECONDS)
+    seconds = time.perf_counter() - start
+    statements, queries = COUNTER.reset()
+    return {
+        "seconds": seconds,
+        "statements": statements,
+        "queries": queries,
+        "exceptions": [e.message for e in at.exception],
+        "errors": [e.value for e in at.error],
+    }
+
+def run_flow(steps):
+    """
+    Runs a flow in a fresh session. Returns one record for the first page load and one per step.
+    """
+    at = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=APP_TIMEOUT_SECONDS)
+    records = [dict(step="load", **timed_run(at))]
+    for step in steps:
+        try:
+            apply_step(at, step)
+        except (LookupError, ValueError) as e:
+            records.append({"step": " ".join(map(str, step)), "failed": str(e)})
+            break
+        records.append(dict(step=" ".join(map(str, step)), **timed_run(at)))
+    return records
+
+def summarize(runs):
+    """
+    Aggregates repeated runs of a flow: per step median/max seconds and statement counts.
+    """
+    steps = {}
+    for records in runs:
+        for record in records:
+            steps.setdefault(record["step"], []).append(record)
+    summary = {}
+    for step, records in steps.items():
+        timed = [r for r in records if "seconds" in r]
+        summary[step] = {
+            "runs": len(records),
+            "failed": sorted({r["failed"] for r in records if "failed" in r}),
+            "median_seconds": statistics.median(r["seconds"] for r in timed) if timed else None,
+            "max_seconds": max(r["seconds"] for r in timed) if timed else None,
+            "statements": max(r["statements"] for r in timed) if timed else None,
+            "exceptions": sorted({m for r in timed for m in r["exceptions"]}),
+            "errors": sorted({m for r in timed for m in r["errors"]}),
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Run app.py page flows headlessly and time each rerun.")
+    parser.add_argument("--flows", help="JSON file of extra flows ({name: [[action, label, value], ...]})")
+    parser.add_argument("--only", nargs="*", help="run only these flows")
+    parser.add_argument("--repeat", type=int, default=5, help="times to run each flow, each in a new session")
+    parser.add_argument("--output", default=os.path.join(APP_DIR, "ui_harness_results.json"))
+    parser.add_argument("--show-sql", action="store_true", help="print the statements of each step")
+    args = parser.parse_args()
+
+    flows = dict(DEFAULT_FLOWS)
+    if args.flows:
+        with open(args.flows) as f:
+            flows.update(json.load(f))
+    if args.only:
+        flows = {name: flows[name] for name in args.only}
+
+    install_statement_counter()
+    os.chdir(APP_DIR)
+
+    results = {}
+    failed = False
+    for name, steps in flows.items():
+        runs = [run_flow(steps) for _ in range(args.repeat)]
+        results[name] = summarize(runs)
+        print(f"\n{name}")
+        for step, stats in results[name].items():
+            if stats["median_seconds"] is None:
+                print(f"  {step:<70} FAILED: {'; '.join(stats['failed'])}")
+            else:
+                print(f"  {step:<70} median {stats['median_seconds'] * 1000:9.1f} ms   "
+                      f"max {stats['max_seconds'] * 1000:9.1f} ms   {stats['statements']:4d} statements")
+            for message in stats["exceptions"] + stats["errors"] + stats["failed"]:
+                print(f"    ! {message}")
+            failed = failed or bool(stats["exceptions"] or stats["failed"])
+        if args.show_sql:
+            for record in runs[-1]:
+                print(f"  -- {record['step']}")
+                for query in record.get("queries", []):
+                    print("     " + " ".join(query.split())[:160])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()